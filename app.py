@@ -1,16 +1,35 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_migrate import Migrate
-from models import db, User, DailyFortune, MBTITrait, ChineseZodiac
+from flask_login import LoginManager, current_user
+from models import db, User, DailyFortune, MBTITrait, UserFortune
 from forms import LoginForm, RegistrationForm, EditAccountForm
 from datetime import datetime, timezone
-from openai import OpenAI
+from openai import APIConnectionError, InternalServerError, OpenAI, RateLimitError
 from dotenv import load_dotenv
 from functools import wraps
-import requests
+import click
 import os
 import logging
+import time
+from rate_limiter import OpenAIRateLimiter, PRIORITY_INTERACTIVE, estimate_tokens
+from local_fortune import generate_local_fortune, share_bucket
+from zodiac_cache import zodiac_fortunes
+from db_routing import init_replica
+from identity import remember_identity, forget_identity, session_is_current
+import assets
+import compression
+import health
+import cohorts
+from pagination import InvalidCursor, keyset_page, parse_limit
+from horoscope_provider import ProviderConfigError, build_provider, prune_cache
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from app_flags import claim_first_admin
+import template_cache
+import request_profiler
+from request_profiler import upstream_call
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +39,8 @@ load_dotenv()
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'default-dev-key-change-in-production')
+# Requests slower than this are logged with a query/upstream breakdown (see request_profiler.py)
+app.config['SLOW_REQUEST_THRESHOLD_MS'] = float(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '1000'))
 
 # Database configuration with better error handling
 database_url = os.getenv('DATABASE_URL')
@@ -56,18 +77,53 @@ if safe_db_url and '@' in safe_db_url:
 logger.info(f"Using database: {safe_db_url}")
 
 # Initialize extensions
+# Flask runs after_request handlers in reverse registration order, so
+# compression is registered before every other extension to run last
+compression.init_app(app)
 db.init_app(app)
+# Optional read replica for read-only queries (see db_routing.py)
+init_replica(app, os.getenv('DATABASE_REPLICA_URL'))
 bcrypt = Bcrypt(app)
 migrate = Migrate(app, db)
+# No template context processor: it would load the User row on every render
+login_manager = LoginManager(app, add_context_processor=False)
+# Identity lives in our own session keys (see identity.py), not Flask-Login's
+login_manager.session_protection = None
+request_profiler.init_app(app)
+assets.init_app(app)
+template_cache.init_app(app)
 
 # Initialize OpenAI client if API key is available
 openai_api_key = os.getenv('OPENAI_API_KEY')
 if openai_api_key:
-    client = OpenAI(api_key=openai_api_key)
+    # The SDK does not retry: a 429 pauses every caller through the shared rate
+    # limiter, and transient errors are retried with jittered backoff under the
+    # limiter's control (see generate_unique_fortune)
+    client = OpenAI(api_key=openai_api_key, max_retries=0)
 else:
     logger.warning("OPENAI_API_KEY not found. AI fortune generation will be disabled.")
     client = None
 
+# Shared by every call site of generate_unique_fortune() in this process
+openai_limiter = OpenAIRateLimiter.from_env()
+# How long an interactive request waits for capacity before using the fallback
+OPENAI_INTERACTIVE_TIMEOUT = float(os.getenv('OPENAI_INTERACTIVE_TIMEOUT', '5'))
+# Share of fortunes (0.0 - 1.0) served by the local engine even when OpenAI is available
+LOCAL_FORTUNE_SHARE = float(os.getenv('LOCAL_FORTUNE_SHARE', '0'))
+
+# live | record | replay (see horoscope_provider.py)
+HOROSCOPE_PROVIDER_MODE = os.getenv('HOROSCOPE_PROVIDER_MODE', 'live')
+HOROSCOPE_CACHE_DIR = os.getenv('HOROSCOPE_CACHE_DIR', os.path.join(app.instance_path, 'horoscope_cache'))
+HOROSCOPE_CASSETTE_DIR = os.getenv('HOROSCOPE_CASSETTE_DIR', os.path.join(app.instance_path, 'horoscope_cassettes'))
+# Days of cached horoscope responses kept; older days are dropped by the web process as it caches a new day
+HOROSCOPE_CACHE_RETENTION_DAYS = int(os.getenv('HOROSCOPE_CACHE_RETENTION_DAYS', '2'))
+
+def get_horoscope_provider(async_http=None):
+    """Build the horoscope provider for the configured mode (raises ProviderConfigError)"""
+    return build_provider(HOROSCOPE_PROVIDER_MODE, os.getenv('RAPIDAPI_KEY'),
+                          HOROSCOPE_CACHE_DIR, HOROSCOPE_CASSETTE_DIR, async_http=async_http,
+                          cache_keep_days=HOROSCOPE_CACHE_RETENTION_DAYS)
+
 # Ensure proper context is pushed - with error handling for database connection
 with app.app_context():
     try:
@@ -80,11 +136,23 @@ with app.app_context():
             from sqlalchemy import text
             db.session.execute(text('SELECT 1'))
             logger.info("Database connection verified")
+        zodiac_fortunes.load()
     except Exception as e:
         logger.error(f"Database connection error: {e}")
         # Don't fail startup completely, as migrations might fix the issue
         # and we want the Flask CLI commands to be available
 
+@login_manager.request_loader
+def load_user_from_session(request):
+    """Load the logged in user for flask_login.current_user (cached for the request)"""
+    user_id = session.get('user_id')
+    return db.session.get(User, user_id) if user_id is not None else None
+
+def _reject_stale_session():
+    forget_identity(session)
+    flash('Your session has expired. Please log in again', 'warning')
+    return redirect(url_for('login'))
+
 # Admin role required decorator
 def admin_required(f):
     @wraps(f)
@@ -94,8 +162,10 @@ def admin_required(f):
             flash('Please log in to access this page', 'warning')
             return redirect(url_for('login'))
         
-        user = User.query.get(session['user_id'])
-        if not user or user.role != 'admin':
+        # Role comes from the signed session; no user query unless it changed
+        if not session_is_current(session):
+            return _reject_stale_session()
+        if session.get('role') != 'admin':
             flash('You do not have permission to access this page', 'danger')
             return redirect(url_for('daily_fortune'))
         
@@ -109,6 +179,32 @@ def login_required(f):
         if 'user_id' not in session:
             flash('Please log in to access this page', 'warning')
             return redirect(url_for('login'))
+        if not session_is_current(session):
+            return _reject_stale_session()
+        return f(*args, **kwargs)
+    return decorated_function
+
+def _api_error(message, status):
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+# JSON API equivalents of the decorators above: errors instead of redirects
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session or not session_is_current(session):
+            return _api_error('authentication required', 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
+def api_admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session or not session_is_current(session):
+            return _api_error('authentication required', 401)
+        if session.get('role') != 'admin':
+            return _api_error('admin role required', 403)
         return f(*args, **kwargs)
     return decorated_function
 
@@ -116,6 +212,21 @@ def login_required(f):
 def index():
     return render_template('index.html')
 
+@app.route('/healthz')
+def healthz():
+    # Liveness only: no database, session or template work
+    return 'ok', 200, {'Content-Type': 'text/plain', 'Cache-Control': 'no-store'}
+
+@app.route('/readyz')
+def readyz():
+    report, ready = health.readiness(app, openai_limiter, client is not None,
+                                     timeout=float(os.getenv('READYZ_DB_TIMEOUT', '1')),
+                                     cache_seconds=float(os.getenv('READYZ_CACHE_SECONDS', '5')))
+    response = jsonify(report)
+    response.status_code = 200 if ready else 503
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     # If user is already logged in, redirect to daily_fortune
@@ -126,10 +237,8 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
         if user and bcrypt.check_password_hash(user.password, form.password.data):
-            session['user_id'] = user.id
-            session['username'] = user.username
-            # Set admin status in session
-            session['is_admin'] = (user.role == 'admin')
+            # Identity, role and auth version live in the signed session
+            remember_identity(session, user)
             flash('Login successful!', 'success')
             return redirect(url_for('daily_fortune'))
         else:
@@ -144,15 +253,24 @@ def signup():
         
     form = RegistrationForm()
     if form.validate_on_submit():
+        # End the read transaction of the uniqueness probes so nothing is held while bcrypt runs
+        db.session.rollback()
         hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
         new_user = User(name=form.name.data, birthday=form.birthday.data, username=form.username.data,
                         email=form.email.data, password=hashed_password, mbti=form.mbti.data)
         new_user.chinese_zodiac = get_chinese_zodiac(new_user.birthday.year)
-        # First user is admin, others are normal users
-        if User.query.count() == 0:
-            new_user.role = 'admin'
-        db.session.add(new_user)
-        db.session.commit()
+        try:
+            # First user is admin, others are normal users
+            new_user.role = 'admin' if claim_first_admin(db.session) else 'user'
+            db.session.add(new_user)
+            cohorts.record_user_change(db.session, new=user_cohort_values(new_user))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            # A concurrent signup took the username or email; re-run the probes to say which
+            if form.validate():
+                flash('Your account could not be created. Please try again', 'danger')
+            return render_template('signup.html', form=form)
         flash('Your account has been created! You are now able to log in', 'success')
         return redirect(url_for('login'))
     return render_template('signup.html', form=form)
@@ -160,16 +278,18 @@ def signup():
 @app.route('/edit_account', methods=['GET', 'POST'])
 @login_required
 def edit_account():
-    user = User.query.get(session['user_id'])
+    user = current_user
     form = EditAccountForm(obj=user)
 
     if form.validate_on_submit():
+        old_cohorts = user_cohort_values(user)
         user.name = form.name.data
         user.birthday = form.birthday.data
         user.username = form.username.data
         user.email = form.email.data
         user.mbti = form.mbti.data
         user.chinese_zodiac = get_chinese_zodiac(user.birthday.year)
+        cohorts.record_user_change(db.session, old=old_cohorts, new=user_cohort_values(user))
 
         db.session.commit()
         flash('Your account has been updated successfully!', 'success')
@@ -188,30 +308,8 @@ def get_zodiac_sign(day, month):
     Returns:
         str: The zodiac sign
     """
-    if (month == 12 and day >= 22) or (month == 1 and day <= 19):
-        return "capricorn"
-    elif (month == 1 and day >= 20) or (month == 2 and day <= 18):
-        return "aquarius"
-    elif (month == 2 and day >= 19) or (month == 3 and day <= 20):
-        return "pisces"
-    elif (month == 3 and day >= 21) or (month == 4 and day <= 19):
-        return "aries"
-    elif (month == 4 and day >= 20) or (month == 5 and day <= 20):
-        return "taurus"
-    elif (month == 5 and day >= 21) or (month == 6 and day <= 20):
-        return "gemini"
-    elif (month == 6 and day >= 21) or (month == 7 and day <= 22):
-        return "cancer"
-    elif (month == 7 and day >= 23) or (month == 8 and day <= 22):
-        return "leo"
-    elif (month == 8 and day >= 23) or (month == 9 and day <= 22):
-        return "virgo"
-    elif (month == 9 and day >= 23) or (month == 10 and day <= 22):
-        return "libra"
-    elif (month == 10 and day >= 23) or (month == 11 and day <= 21):
-        return "scorpio"
-    else:
-        return "sagittarius"
+    # One table (cohorts.SUN_SIGN_STARTS) for pages, the importer and the cohort counters
+    return cohorts.sun_sign(day, month)
 
 def get_chinese_zodiac(year):
     """
@@ -226,144 +324,350 @@ def get_chinese_zodiac(year):
     zodiacs = ["Rat", "Ox", "Tiger", "Rabbit", "Dragon", "Snake", "Horse", "Sheep", "Monkey", "Rooster", "Dog", "Pig"]
     return zodiacs[(year - 4) % 12]
 
-def generate_unique_fortune(astrological_fortune, mbti_strengths, mbti_weaknesses, chinese_zodiac_fortune):
+def user_cohort_values(user):
+    """Cohort values used for the analytics counters"""
+    return cohorts.user_cohorts(get_zodiac_sign(user.birthday.day, user.birthday.month), user.mbti,
+                                user.chinese_zodiac)
+
+FORTUNE_MODEL = "gpt-3.5-turbo"
+
+def fortune_messages(astrological_fortune, mbti_strengths, mbti_weaknesses, chinese_zodiac_fortune):
+    """Chat messages asking OpenAI for a fortune (shared by the sync and async generators)"""
+    # Missing inputs (None) are spelled out for the model; the local engine just leaves them out
+    astrological_fortune = astrological_fortune or 'Unable to fetch your fortune. Please try again later.'
+    mbti_strengths = mbti_strengths or 'No strengths available.'
+    mbti_weaknesses = mbti_weaknesses or 'No weaknesses available.'
+    chinese_zodiac_fortune = chinese_zodiac_fortune or 'No fortune available.'
+    prompt = f""" 
+    Astrological Fortune: {astrological_fortune}
+    MBTI Strengths: {mbti_strengths}
+    MBTI Weaknesses: {mbti_weaknesses}
+    Chinese Zodiac Fortune: {chinese_zodiac_fortune}
+
+    Generate a unique daily fortune for user, using mainly the daily astrological fortune, but incorporate some of the other factors, and keep it under 70 words.
+    """
+    system_prompt = "You are an AI that generates unique daily fortunes for users."
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+
+class FortuneRequest:
+    """
+    One fortune generation, minus the OpenAI call itself
+
+    Holds the local fallback, the prompt and the token estimate, and does the
+    rate limiter bookkeeping around the call. The sync generator below and
+    the coroutine in asgi.py differ only in how they acquire capacity, wait
+    between retries and await the completion.
+    """
+
+    def __init__(self, astrological_fortune, mbti_strengths, mbti_weaknesses, chinese_zodiac_fortune,
+                 openai_available, priority=PRIORITY_INTERACTIVE, timeout=None, seed_key=None):
+        if seed_key is None:
+            seed_key = (astrological_fortune, mbti_strengths, mbti_weaknesses, chinese_zodiac_fortune)
+        self.fallback = generate_local_fortune(seed_key, astrological_fortune, mbti_strengths, mbti_weaknesses,
+                                               chinese_zodiac_fortune)
+        self.use_openai = openai_available and share_bucket(*seed_key) >= LOCAL_FORTUNE_SHARE
+        self.messages = fortune_messages(astrological_fortune, mbti_strengths, mbti_weaknesses, chinese_zodiac_fortune)
+        self.priority = priority
+        if timeout is None and priority == PRIORITY_INTERACTIVE:
+            timeout = OPENAI_INTERACTIVE_TIMEOUT
+        self.timeout = timeout
+        self.estimated = estimate_tokens(*(message["content"] for message in self.messages))
+
+    def capacity_unavailable(self):
+        logger.warning("OpenAI capacity unavailable, using fallback fortune")
+        return self.fallback
+
+    def succeeded(self, raw):
+        """Reconcile the limiter with a raw chat completion response and return its text"""
+        completion = raw.parse()
+        used = completion.usage.total_tokens if completion.usage else None
+        openai_limiter.complete(self.estimated, used_tokens=used, headers=raw.headers)
+        return completion.choices[0].message.content.strip()
+
+    def retry_delay(self, error, attempt):
+        """Seconds to wait before retrying after `error`, or None if the call should fail now"""
+        if not isinstance(error, (APIConnectionError, InternalServerError)):
+            return None
+        delay = openai_limiter.retry_delay(self.estimated, attempt)
+        if delay is not None:
+            logger.warning(f"Transient OpenAI error, retrying in {delay:.2f}s: {error}")
+        return delay
+
+    def failed(self, error):
+        """Tell the limiter about a failed call and return the fallback"""
+        if isinstance(error, RateLimitError):
+            openai_limiter.rate_limited(headers=error.response.headers)
+            logger.error(f"OpenAI rate limit exceeded: {error}")
+        else:
+            openai_limiter.failed()
+            logger.error(f"Error generating fortune with OpenAI: {error}")
+        return self.fallback
+
+def generate_unique_fortune(astrological_fortune, mbti_strengths, mbti_weaknesses, chinese_zodiac_fortune,
+                            priority=PRIORITY_INTERACTIVE, timeout=None, seed_key=None):
     """
     Generate a unique fortune using AI based on various attributes
     
     Args:
-        astrological_fortune (str): Daily astrological fortune
-        mbti_strengths (str): MBTI personality strengths
-        mbti_weaknesses (str): MBTI personality weaknesses
-        chinese_zodiac_fortune (str): Chinese zodiac fortune
+        astrological_fortune (str): Daily astrological fortune, or None if there is none yet
+        mbti_strengths (str): MBTI personality strengths, or None
+        mbti_weaknesses (str): MBTI personality weaknesses, or None
+        chinese_zodiac_fortune (str): Chinese zodiac fortune, or None
+        priority (int): Rate limiter priority, PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND
+        timeout (float): Seconds to wait for rate limit capacity; defaults to
+            OPENAI_INTERACTIVE_TIMEOUT for interactive calls and no limit otherwise
+        seed_key (tuple): Identifies the fortune for the local engine, usually (user id, date)
         
     Returns:
         str: Generated unique fortune
     """
-    if client is None:
-        return f"Daily Fortune: {astrological_fortune}\n\nConsider your MBTI strengths: {mbti_strengths}\n\nBe mindful of: {mbti_weaknesses}\n\nChinese Zodiac Guidance: {chinese_zodiac_fortune}"
-        
-    prompt = f""" 
-    Astrological Fortune: {astrological_fortune}
-    MBTI Strengths: {mbti_strengths}
-    MBTI Weaknesses: {mbti_weaknesses}
-    Chinese Zodiac Fortune: {chinese_zodiac_fortune}
+    fortune_request = FortuneRequest(astrological_fortune, mbti_strengths, mbti_weaknesses, chinese_zodiac_fortune,
+                                     client is not None, priority=priority, timeout=timeout, seed_key=seed_key)
+    if not fortune_request.use_openai:
+        return fortune_request.fallback
+
+    attempt = 0
+    while True:
+        if not openai_limiter.acquire(fortune_request.estimated, priority=fortune_request.priority,
+                                      timeout=fortune_request.timeout):
+            return fortune_request.capacity_unavailable()
+        try:
+            with upstream_call('openai'):
+                raw = client.chat.completions.with_raw_response.create(model=FORTUNE_MODEL,
+                                                                       messages=fortune_request.messages)
+            return fortune_request.succeeded(raw)
+        except Exception as e:
+            attempt += 1
+            delay = fortune_request.retry_delay(e, attempt)
+            if delay is None:
+                return fortune_request.failed(e)
+        time.sleep(delay)
 
-    Generate a unique daily fortune for user, using mainly the daily astrological fortune, but incorporate some of the other factors, and keep it under 70 words.
+def fortune_inputs(db_session, user, today):
+    """
+    Load what the fortune generator needs for a user
+
+    Returns:
+        tuple: (astrological_fortune, mbti_strengths, mbti_weaknesses), each None if missing
     """
+    zodiac_sign = get_zodiac_sign(user.birthday.day, user.birthday.month)
+    astrological_fortune = db_session.scalar(
+        select(DailyFortune.fortune).where(DailyFortune.zodiac_sign == zodiac_sign, DailyFortune.date == today).limit(1)
+    )
 
+    mbti_trait_record = db_session.scalar(select(MBTITrait).where(MBTITrait.type == user.mbti).limit(1))
+    mbti_strengths = mbti_trait_record.strengths if mbti_trait_record else None
+    mbti_weaknesses = mbti_trait_record.weaknesses if mbti_trait_record else None
+    return astrological_fortune, mbti_strengths, mbti_weaknesses
+
+def store_user_fortune(db_session, user, today, fortune):
+    """
+    Store the generated fortune and the date, and keep it in the user's history
+
+    Returns:
+        str: The fortune kept for today; when a concurrent request stored one
+            first, that one, and nothing is written or counted twice
+    """
+    user_id = user.id
     try:
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an AI that generates unique daily fortunes for users."},
-                {"role": "user", "content": prompt}
-            ]
+        user.last_fortune = fortune
+        user.last_fortune_date = today
+        db_session.add(UserFortune(user_id=user_id, date=today, fortune=fortune))
+        # Hit the (user_id, date) constraint before counting the user as active
+        db_session.flush()
+        cohorts.record_active(db_session, today)
+        db_session.commit()
+    except IntegrityError:
+        db_session.rollback()
+        return db_session.scalar(
+            select(UserFortune.fortune).where(UserFortune.user_id == user_id, UserFortune.date == today)
         )
-        return completion.choices[0].message.content.strip()
-    except Exception as e:
-        logger.error(f"Error generating fortune with OpenAI: {e}")
-        return f"Daily Fortune: {astrological_fortune}\n\nConsider your MBTI strengths: {mbti_strengths}\n\nBe mindful of: {mbti_weaknesses}\n\nChinese Zodiac Guidance: {chinese_zodiac_fortune}"
+    return fortune
 
-@app.route('/daily_fortune')
-@login_required
-def daily_fortune():
-    user = User.query.get(session['user_id'])
-    today = datetime.now(timezone.utc).date()
-    birthday = user.birthday
-    zodiac_sign = get_zodiac_sign(birthday.day, birthday.month)
+def get_or_generate_fortune(user, today):
+    """
+    Return the user's fortune for today, generating and storing it if needed
+    
+    Args:
+        user (User): The user
+        today (date): Today's date (UTC)
+        
+    Returns:
+        tuple: (fortune, chinese_zodiac_fortune, generated) where generated is
+            True if the fortune was created by this call
+    """
+    chinese_zodiac_fortune = zodiac_fortunes.get(user.chinese_zodiac)
 
     # Check if the fortune has already been generated today
     if user.last_fortune and user.last_fortune_date == today:
-        fortune = user.last_fortune
-        chinese_zodiac_fortune_record = ChineseZodiac.query.filter_by(sign=user.chinese_zodiac).first()
-        chinese_zodiac_fortune = chinese_zodiac_fortune_record.yearly_fortune_2024 if chinese_zodiac_fortune_record else 'No fortune available.'
-    else:
-        fortune_record = DailyFortune.query.filter_by(zodiac_sign=zodiac_sign, date=today).first()
-        if fortune_record:
-            astrological_fortune = fortune_record.fortune
-        else:
-            astrological_fortune = 'Unable to fetch your fortune. Please try again later.'
+        return user.last_fortune, chinese_zodiac_fortune or 'No fortune available.', False
 
-        chinese_zodiac_fortune_record = ChineseZodiac.query.filter_by(sign=user.chinese_zodiac).first()
-        chinese_zodiac_fortune = chinese_zodiac_fortune_record.yearly_fortune_2024 if chinese_zodiac_fortune_record else 'No fortune available.'
+    astrological_fortune, mbti_strengths, mbti_weaknesses = fortune_inputs(db.session, user, today)
+    fortune = generate_unique_fortune(astrological_fortune, mbti_strengths, mbti_weaknesses, chinese_zodiac_fortune,
+                                      seed_key=(user.id, today.isoformat()))
+    fortune = store_user_fortune(db.session, user, today, fortune)
+    return fortune, chinese_zodiac_fortune or 'No fortune available.', True
 
-        mbti_trait_record = MBTITrait.query.filter_by(type=user.mbti).first()
-        mbti_strengths = mbti_trait_record.strengths if mbti_trait_record else 'No strengths available.'
-        mbti_weaknesses = mbti_trait_record.weaknesses if mbti_trait_record else 'No weaknesses available.'
+@app.route('/daily_fortune')
+@login_required
+def daily_fortune():
+    user = current_user
+    today = datetime.now(timezone.utc).date()
+    zodiac_sign = get_zodiac_sign(user.birthday.day, user.birthday.month)
 
-        fortune = generate_unique_fortune(astrological_fortune, mbti_strengths, mbti_weaknesses, chinese_zodiac_fortune)
-        
-        # Store the generated fortune and the date
-        user.last_fortune = fortune
-        user.last_fortune_date = today
-        db.session.commit()
+    fortune, chinese_zodiac_fortune, generated = get_or_generate_fortune(user, today)
+    if generated:
         flash('Your daily fortune has been generated!', 'info')
 
     current_date_str = datetime.now().strftime('%B %d, %Y')
     return render_template('fortune.html', user=user, zodiac_sign=zodiac_sign, current_date=current_date_str, fortune=fortune, chinese_zodiac_fortune=chinese_zodiac_fortune)
 
+ZODIAC_SIGNS = ["capricorn", "aquarius", "pisces", "aries", "taurus", "gemini", "cancer", "leo", "virgo", "libra", "scorpio", "sagittarius"]
+
+def store_daily_fortunes(db_session, today, responses):
+    """
+    Store today's horoscopes, skipping rows that would only duplicate today's text
+
+    Args:
+        db_session: SQLAlchemy session
+        today (date): The day the horoscopes are for
+        responses (dict): sign -> HoroscopeResponse
+    """
+    existing = set(db_session.execute(
+        select(DailyFortune.zodiac_sign, DailyFortune.fortune).where(DailyFortune.date == today)
+    ).tuples())
+    for sign, response in responses.items():
+        fortune = response.horoscope
+        if fortune is None:
+            logger.warning(f"Failed to get fortune for {sign}. Status code: {response.status_code}")
+        elif (sign, fortune) not in existing:
+            db_session.add(DailyFortune(zodiac_sign=sign, date=today, fortune=fortune))
+    db_session.commit()
 
 @app.route('/generate_fortunes', methods=['GET', 'POST'])
 @admin_required
 def generate_fortunes():
     if request.method == 'POST':
-        zodiac_signs = ["capricorn", "aquarius", "pisces", "aries", "taurus", "gemini", "cancer", "leo", "virgo", "libra", "scorpio", "sagittarius"]
-        
-        rapidapi_key = os.getenv('RAPIDAPI_KEY')
-        if not rapidapi_key:
-            flash('RapidAPI key is missing. Please configure the RAPIDAPI_KEY environment variable.', 'danger')
+        try:
+            provider = get_horoscope_provider()
+        except ProviderConfigError as e:
+            flash(str(e), 'danger')
             return redirect(url_for('generate_fortunes'))
-            
-        url = "https://horoscope-astrology.p.rapidapi.com/horoscope?day=today&sunsign={}"
-        headers = {
-            'x-rapidapi-host': "horoscope-astrology.p.rapidapi.com",
-            'x-rapidapi-key': rapidapi_key
-        }
 
+        today = datetime.now(timezone.utc).date()
         try:
-            for sign in zodiac_signs:
-                response = requests.get(url.format(sign), headers=headers)
-                if response.status_code == 200:
-                    data = response.json()
-                    fortune = data.get('horoscope', 'No fortune available today.')
-                    new_fortune = DailyFortune(zodiac_sign=sign, fortune=fortune)
-                    db.session.add(new_fortune)
-                else:
-                    logger.warning(f"Failed to get fortune for {sign}. Status code: {response.status_code}")
-            
-            db.session.commit()
+            # Cached responses make re-runs cheap
+            responses = {sign: provider.fetch(sign, today) for sign in ZODIAC_SIGNS}
+            store_daily_fortunes(db.session, today, responses)
             flash('Daily fortunes have been generated successfully!', 'success')
         except Exception as e:
             db.session.rollback()
             logger.error(f"Error generating fortunes: {e}")
             flash(f'Error generating fortunes: {str(e)}', 'danger')
-            
+
         return redirect(url_for('generate_fortunes'))
-    
+
     return render_template('generate_fortunes.html')
 
+@app.route('/analytics')
+@admin_required
+def analytics():
+    stats = cohorts.summary(db.session, datetime.now(timezone.utc).date())
+    return render_template('analytics.html', stats=stats)
+
+# JSON API, version 1
+def _conditional_json(payload):
+    """JSON response with an ETag, answered with 304 when the client already has it"""
+    response = jsonify(payload)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+def _fortune_page(stmt, date_column, id_column):
+    try:
+        rows, next_cursor = keyset_page(db.session, stmt, date_column, id_column,
+                                        cursor=request.args.get('cursor'),
+                                        limit=parse_limit(request.args.get('limit')))
+    except InvalidCursor:
+        return _api_error('invalid cursor', 400)
+    items = [{**row, 'date': row['date'].isoformat()} for row in rows]
+    return _conditional_json({'items': items, 'next_cursor': next_cursor})
+
+@app.route('/api/v1/login', methods=['POST'])
+def api_login():
+    # JSON bodies only: a cross-site HTML form cannot send one, so no CSRF token is needed
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('username'), str) \
+            or not isinstance(data.get('password'), str):
+        return _api_error('username and password required', 400)
+    user = User.query.filter_by(username=data['username']).first()
+    if not user or not bcrypt.check_password_hash(user.password, data['password']):
+        return _api_error('invalid username or password', 401)
+    # Same signed session cookie as the HTML login
+    remember_identity(session, user)
+    return jsonify({'user_id': user.id, 'username': user.username, 'role': user.role})
+
+@app.route('/api/v1/logout', methods=['POST'])
+def api_logout():
+    forget_identity(session)
+    return '', 204
+
+@app.route('/api/v1/fortune/today')
+@api_login_required
+def api_fortune_today():
+    user = current_user
+    today = datetime.now(timezone.utc).date()
+    fortune, chinese_zodiac_fortune, _ = get_or_generate_fortune(user, today)
+    return _conditional_json({
+        'date': today.isoformat(),
+        'zodiac_sign': get_zodiac_sign(user.birthday.day, user.birthday.month),
+        'chinese_zodiac': user.chinese_zodiac,
+        'mbti': user.mbti,
+        'fortune': fortune,
+        'chinese_zodiac_fortune': chinese_zodiac_fortune,
+    })
+
+@app.route('/api/v1/fortunes/history')
+@api_login_required
+def api_fortune_history():
+    stmt = select(UserFortune.id, UserFortune.date, UserFortune.fortune).where(
+        UserFortune.user_id == session['user_id']
+    )
+    return _fortune_page(stmt, UserFortune.date, UserFortune.id)
+
+@app.route('/api/v1/admin/daily-fortunes')
+@api_admin_required
+def api_daily_fortunes():
+    stmt = select(DailyFortune.id, DailyFortune.date, DailyFortune.zodiac_sign, DailyFortune.fortune)
+    sign = request.args.get('sign')
+    if sign:
+        stmt = stmt.where(DailyFortune.zodiac_sign == sign.lower())
+    return _fortune_page(stmt, DailyFortune.date, DailyFortune.id)
+
 @app.route('/logout')
 def logout():
-    session.pop('user_id', None)
-    session.pop('username', None)
-    session.pop('is_admin', None)
+    forget_identity(session)
     flash('You have been logged out!', 'info')
     return redirect(url_for('index'))
 
 # CLI commands for database management
 @app.cli.command("seed-db")
-def seed_database():
+@click.option('--force', is_flag=True, help='Rewrite reference data even if it has not changed.')
+def seed_database(force):
     """Seed the database with initial data."""
     from seed_mbti import seed_mbti_data
     from seed_chinese_zodiac import seed_chinese_zodiac_data
     
     try:
         # Seed MBTI data
-        seed_mbti_data(db)
+        seed_mbti_data(db, force=force)
         logger.info("MBTI data seeded successfully")
         
         # Seed Chinese Zodiac data
-        seed_chinese_zodiac_data(db)
+        seed_chinese_zodiac_data(db, force=force)
         logger.info("Chinese Zodiac data seeded successfully")
         
         print("Database seeded successfully!")
@@ -371,6 +675,82 @@ def seed_database():
         logger.error(f"Error seeding database: {e}")
         print(f"Error seeding database: {e}")
 
+@app.cli.command("rebuild-cohorts")
+@click.option('--if-empty', is_flag=True, help='Only rebuild when no statistics exist yet.')
+def rebuild_cohorts(if_empty):
+    """Recompute the cohort statistics from the user table."""
+    try:
+        if if_empty and not cohorts.rebuild_if_empty(db.session):
+            print("Cohort statistics already present, nothing to do.")
+            return
+        if not if_empty:
+            cohorts.rebuild(db.session)
+        print("Cohort statistics rebuilt successfully!")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error rebuilding cohort statistics: {e}")
+        # Exit status 1, so the release step stops the deploy
+        raise click.ClickException(f"Error rebuilding cohort statistics: {e}")
+
+@app.cli.command("prune")
+@click.option('--daily-retention-days', type=int, default=lambda: int(os.getenv('DAILY_FORTUNE_RETENTION_DAYS', '90')),
+              show_default='90', help='Keep DailyFortune rows this many days before archiving.')
+@click.option('--user-retention-days', type=int, default=lambda: int(os.getenv('USER_FORTUNE_RETENTION_DAYS', '365')),
+              show_default='365', help='Keep UserFortune rows this many days before archiving.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per archive batch and transaction.')
+@click.option('--no-vacuum', is_flag=True, help='Skip VACUUM/ANALYZE afterwards.')
+@click.option('--horoscope-cache-days', type=int, default=HOROSCOPE_CACHE_RETENTION_DAYS, show_default=True,
+              help='Keep cached horoscope responses this many days (when the cache is on this machine).')
+def prune_command(daily_retention_days, user_retention_days, batch_size, no_vacuum, horoscope_cache_days):
+    """Deduplicate, archive and compact the fortune tables, and drop old horoscope cache days."""
+    import retention
+
+    error = None
+    try:
+        report = retention.prune(db.session, db.engine, datetime.now(timezone.utc).date(),
+                                 daily_retention_days, user_retention_days,
+                                 batch_size=batch_size, vacuum=not no_vacuum)
+        logger.info(f"Prune finished: {report}")
+        print(f"Pruned: {report['duplicates_deleted']} duplicates deleted, "
+              f"{report['daily_fortune_archived']} daily fortunes and "
+              f"{report['user_fortune_archived']} user fortunes archived.")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error pruning fortunes: {e}")
+        error = e
+
+    removed = prune_cache(HOROSCOPE_CACHE_DIR, datetime.now(timezone.utc).date(), horoscope_cache_days)
+    print(f"Removed {removed} horoscope cache days from {HOROSCOPE_CACHE_DIR}.")
+    if error is not None:
+        # Exit status 1, so the cron job reports the failure
+        raise click.ClickException(f"Error pruning fortunes: {error}")
+
+@app.cli.command("query-archive")
+@click.argument('table', type=click.Choice(['daily_fortune', 'user_fortune']))
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='Earliest date (YYYY-MM-DD).')
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), help='Latest date (YYYY-MM-DD).')
+@click.option('--sign', help='Only rows for this zodiac sign (daily_fortune).')
+@click.option('--user-id', type=int, help='Only rows for this user (user_fortune).')
+def query_archive_command(table, since, until, sign, user_id):
+    """Print archived rows as JSONL."""
+    import json
+    import retention
+
+    filters = {}
+    if sign:
+        filters['zodiac_sign'] = sign.lower()
+    if user_id is not None:
+        filters['user_id'] = user_id
+    for row in retention.iter_archive(db.session, table, since.date() if since else None,
+                                      until.date() if until else None, **filters):
+        print(json.dumps(row))
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Build fingerprinted, precompressed static assets."""
+    manifest = assets.build_assets(app.static_folder)
+    print(f"Built {len(manifest)} static assets into {os.path.join(app.static_folder, assets.DIST_DIR)}")
+
 @app.cli.command("create-admin")
 def create_admin():
     """Create an admin user."""
@@ -406,6 +786,7 @@ def create_admin():
         )
         
         db.session.add(admin)
+        cohorts.record_user_change(db.session, new=user_cohort_values(admin))
         db.session.commit()
         print(f"Admin user {username} created successfully!")
     except ValueError:
@@ -414,5 +795,41 @@ def create_admin():
         db.session.rollback()
         print(f"Error creating admin: {e}")
 
+@app.cli.command("import-users")
+@click.argument('stream', metavar='PATH', type=click.File('r', encoding='utf-8', lazy=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Input format (default: from extension).')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per transaction.')
+@click.option('--workers', type=int, help='Password hashing processes (default: CPU count).')
+def import_users_command(stream, fmt, batch_size, workers):
+    """Import users from a CSV or JSONL file ('-' for stdin)."""
+    from user_transfer import detect_format, import_users
+
+    fmt = detect_format(stream.name, fmt)
+    try:
+        imported, skipped = import_users(
+            db.session, stream, fmt, get_chinese_zodiac,
+            batch_size=batch_size,
+            rounds=app.config.get('BCRYPT_LOG_ROUNDS', 12),
+            workers=workers,
+            progress=lambda imported, skipped: click.echo(f"Imported {imported}, skipped {skipped}...", err=True),
+            errors=lambda line, message: click.echo(f"Line {line}: {message}", err=True),
+        )
+        print(f"Import finished: {imported} users imported, {skipped} skipped.")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error importing users: {e}")
+        print(f"Error importing users: {e}")
+
+@app.cli.command("export-users")
+@click.argument('stream', metavar='PATH', type=click.File('w', encoding='utf-8', lazy=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Output format (default: from extension).')
+def export_users_command(stream, fmt):
+    """Export all users to a CSV or JSONL file ('-' for stdout)."""
+    from user_transfer import detect_format, export_users
+
+    fmt = detect_format(stream.name, fmt)
+    count = export_users(db.session, stream, fmt)
+    click.echo(f"Exported {count} users.", err=True)
+
 if __name__ == '__main__':
     app.run(debug=False)
@@ -0,0 +1,46 @@
+"""
+One-time application flags.
+
+claim_flag() inserts an AppFlag row with ON CONFLICT DO NOTHING, so exactly
+one transaction wins the claim even when many run at once, and every later
+claim is a single primary-key probe. Signup uses it to make the first account
+an admin without counting the User table.
+"""
+from sqlalchemy import select
+
+from models import AppFlag, User
+from seed_utils import dialect_insert
+
+ADMIN_BOOTSTRAPPED = 'admin_bootstrapped'
+
+
+def claim_flag(session, name):
+    """
+    Set flag `name` in the current transaction
+
+    Returns:
+        bool: True if this call set the flag, False if it was already set
+    """
+    insert_stmt = dialect_insert(session.get_bind(AppFlag).dialect.name)
+    if insert_stmt is not None:
+        stmt = insert_stmt(AppFlag.__table__).values(name=name).on_conflict_do_nothing(index_elements=['name'])
+        return session.execute(stmt).rowcount == 1
+
+    if session.get(AppFlag, name, with_for_update=True) is not None:
+        return False
+    session.add(AppFlag(name=name))
+    session.flush()
+    return True
+
+
+def claim_first_admin(session):
+    """
+    True if the user about to be created should be the bootstrap admin
+
+    Call in the same transaction that inserts the user, so a failed signup
+    releases the claim. Databases that already had users before the flag
+    existed never hand out the claim.
+    """
+    if not claim_flag(session, ADMIN_BOOTSTRAPPED):
+        return False
+    return not session.scalar(select(select(User.id).exists()))
@@ -0,0 +1,362 @@
+"""
+Optional ASGI serving mode.
+
+    uvicorn asgi:application --workers 2
+
+GET /daily_fortune and POST /generate_fortunes run as coroutines on the event
+loop, using AsyncOpenAI, a shared httpx.AsyncClient and SQLAlchemy's asyncio
+engine (aiosqlite or asyncpg). While they wait on OpenAI, RapidAPI or the
+database they hold no thread and no pooled connection, so one worker can have
+hundreds of generations in flight. Every other route is the unchanged Flask
+app, called on a pool of ASGI_WSGI_THREADS threads with its response body
+streamed back to the event loop, so a bcrypt login or a slow JSON API call
+holds up only its own thread.
+
+The async routes run inside a Flask request context. That gives them the same
+session cookie, flash messages, templates and after_request handlers as the
+sync routes. They reuse app.py's database helpers through AsyncSession.run_sync()
+and its FortuneRequest for everything around the OpenAI call. The Chinese
+zodiac cache refreshes in a worker thread, since it reads through db.session.
+Nothing else on the loop may touch db.session either; that includes template
+rendering, which is why app.py disables Flask-Login's context processor.
+Two things differ from the sync routes. They always use the primary database,
+not the read replica. Their SQL also does not show up in the slow-request log,
+because the asyncio engine runs statements in greenlets that cannot see the
+request context.
+
+Needs the packages in requirements-async.txt; bench_serving.py compares this
+mode with the gunicorn sync deployment.
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from flask import flash, redirect, render_template, session, url_for
+from openai import AsyncOpenAI
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+try:
+    import httpx
+except ImportError as e:
+    raise ImportError(f"ASGI mode needs the packages in requirements-async.txt: {e}")
+
+from app import (app, FORTUNE_MODEL, ZODIAC_SIGNS, FortuneRequest, fortune_inputs, get_horoscope_provider,
+                 get_zodiac_sign, openai_limiter, store_daily_fortunes, store_user_fortune)
+from horoscope_provider import ProviderConfigError
+from identity import forget_identity, session_is_current
+from models import db, User
+from request_profiler import upstream_call
+from zodiac_cache import zodiac_fortunes
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+# Outgoing connections shared by all in-flight RapidAPI fetches in this worker
+HTTP_MAX_CONNECTIONS = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', '100'))
+# Threads per worker for the routes that still run as plain Flask views
+WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '32'))
+
+
+def async_database_url(url):
+    """
+    Point a SQLAlchemy URL at the asyncio driver for its backend
+
+    Raises:
+        ValueError: The backend has no supported asyncio driver
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver configured for {backend}")
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    if backend == 'postgresql' and 'sslmode' in url.query:
+        # asyncpg calls it ssl
+        url = url.update_query_dict({'ssl': url.query['sslmode']}).difference_update_query(['sslmode'])
+    return url
+
+
+def wsgi_environ(scope, body):
+    """Build the WSGI environ Flask's request context expects from an ASGI HTTP scope"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send_response(send, response):
+    body = response.get_data()
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _call_wsgi(wsgi_app, environ, loop, send):
+    """Run one WSGI request on the calling (pool) thread, passing its response to the ASGI `send` on `loop`"""
+    response_start = {}
+
+    def send_from_thread(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and response_start.get('sent'):
+            raise exc_info[1].with_traceback(exc_info[2])
+        response_start.update(message={
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+
+    def send_start():
+        # WSGI allows start_response() to be called again until the first body bytes go out
+        if not response_start.get('sent'):
+            response_start['sent'] = True
+            send_from_thread(response_start['message'])
+
+    output = wsgi_app(environ, start_response)
+    try:
+        for chunk in output:
+            if chunk:
+                send_start()
+                send_from_thread({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        send_start()
+        send_from_thread({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(output, 'close'):
+            output.close()
+
+
+class AsyncFortuneApp:
+    """ASGI application: coroutine routes for the I/O-bound paths, Flask for the rest"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi_threads = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+        self.routes = {
+            ('GET', '/daily_fortune'): self.daily_fortune,
+            ('POST', '/generate_fortunes'): self.generate_fortunes,
+        }
+        self.engine = None
+        self.sessions = None
+        self.http = None
+        self.openai = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']}")
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            body = await _read_body(receive)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.wsgi_threads, _call_wsgi, self.flask_app,
+                                       wsgi_environ(scope, body), loop, send)
+            return
+
+        self._start()
+        body = await _read_body(receive)
+        ctx = self.flask_app.request_context(wsgi_environ(scope, body))
+        ctx.push()
+        error = None
+        try:
+            # Same steps as Flask.full_dispatch_request(), with an awaited view
+            try:
+                try:
+                    rv = self.flask_app.preprocess_request()
+                    if rv is None:
+                        rv = await handler()
+                except Exception as e:
+                    rv = self.flask_app.handle_user_exception(e)
+                response = self.flask_app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = self.flask_app.handle_exception(e)
+            await _send_response(send, response)
+        finally:
+            ctx.pop(error)
+
+    def _start(self):
+        """Create the engine and clients (lifespan startup, or the first request without it)"""
+        if self.engine is not None:
+            return
+        with self.flask_app.app_context():
+            # Flask-SQLAlchemy has already resolved relative SQLite paths
+            url = db.engine.url
+        self.engine = create_async_engine(async_database_url(url), pool_pre_ping=True)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.http = httpx.AsyncClient(limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS))
+        openai_api_key = os.getenv('OPENAI_API_KEY')
+        if openai_api_key:
+            # Retries are left to the shared rate limiter, as in app.py
+            self.openai = AsyncOpenAI(api_key=openai_api_key, max_retries=0)
+
+    async def _stop(self):
+        if self.engine is None:
+            return
+        await self.engine.dispose()
+        await self.http.aclose()
+        if self.openai is not None:
+            await self.openai.close()
+        self.engine = None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    self._start()
+                except Exception as e:
+                    logger.error(f"ASGI startup failed: {e}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self._stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _authorize(self, db_session, admin=False):
+        """The checks of app.login_required/admin_required; a redirect if they fail, else None"""
+        if 'user_id' not in session:
+            flash('Please log in to access this page', 'warning')
+            return redirect(url_for('login'))
+        cookie = session._get_current_object()
+        current = await db_session.run_sync(lambda sync_session: session_is_current(cookie, sync_session))
+        # Give the connection back before any slow work
+        await db_session.commit()
+        if not current:
+            forget_identity(session)
+            flash('Your session has expired. Please log in again', 'warning')
+            return redirect(url_for('login'))
+        if admin and session.get('role') != 'admin':
+            flash('You do not have permission to access this page', 'danger')
+            return redirect(url_for('daily_fortune'))
+        return None
+
+    async def generate_unique_fortune(self, astrological_fortune, mbti_strengths, mbti_weaknesses,
+                                      chinese_zodiac_fortune, seed_key):
+        """Coroutine version of app.generate_unique_fortune() for interactive requests"""
+        fortune_request = FortuneRequest(astrological_fortune, mbti_strengths, mbti_weaknesses,
+                                         chinese_zodiac_fortune, self.openai is not None, seed_key=seed_key)
+        if not fortune_request.use_openai:
+            return fortune_request.fallback
+
+        attempt = 0
+        while True:
+            if not await openai_limiter.acquire_async(fortune_request.estimated, priority=fortune_request.priority,
+                                                      timeout=fortune_request.timeout):
+                return fortune_request.capacity_unavailable()
+            try:
+                with upstream_call('openai'):
+                    raw = await self.openai.chat.completions.with_raw_response.create(
+                        model=FORTUNE_MODEL, messages=fortune_request.messages)
+                return fortune_request.succeeded(raw)
+            except Exception as e:
+                attempt += 1
+                delay = fortune_request.retry_delay(e, attempt)
+                if delay is None:
+                    return fortune_request.failed(e)
+            await asyncio.sleep(delay)
+
+    def _refresh_zodiac_fortunes(self):
+        with self.flask_app.app_context():
+            zodiac_fortunes.refresh()
+
+    async def zodiac_fortune(self, sign):
+        """zodiac_fortunes.get() with the database check, when one is due, done off the event loop"""
+        if zodiac_fortunes.stale():
+            await asyncio.to_thread(self._refresh_zodiac_fortunes)
+        return zodiac_fortunes.get(sign, refresh=False)
+
+    async def daily_fortune(self):
+        async with self.sessions() as db_session:
+            denied = await self._authorize(db_session)
+            if denied is not None:
+                return denied
+
+            user = await db_session.get(User, session['user_id'])
+            today = datetime.now(timezone.utc).date()
+            chinese_zodiac_fortune = await self.zodiac_fortune(user.chinese_zodiac)
+            if user.last_fortune and user.last_fortune_date == today:
+                fortune = user.last_fortune
+            else:
+                inputs = await db_session.run_sync(lambda sync_session: fortune_inputs(sync_session, user, today))
+                await db_session.commit()
+                fortune = await self.generate_unique_fortune(*inputs, chinese_zodiac_fortune,
+                                                             seed_key=(user.id, today.isoformat()))
+                fortune = await db_session.run_sync(
+                    lambda sync_session: store_user_fortune(sync_session, user, today, fortune))
+                flash('Your daily fortune has been generated!', 'info')
+
+        zodiac_sign = get_zodiac_sign(user.birthday.day, user.birthday.month)
+        current_date_str = datetime.now().strftime('%B %d, %Y')
+        return render_template('fortune.html', user=user, zodiac_sign=zodiac_sign, current_date=current_date_str,
+                               fortune=fortune,
+                               chinese_zodiac_fortune=chinese_zodiac_fortune or 'No fortune available.')
+
+    async def generate_fortunes(self):
+        async with self.sessions() as db_session:
+            denied = await self._authorize(db_session, admin=True)
+            if denied is not None:
+                return denied
+            try:
+                provider = get_horoscope_provider(async_http=self.http)
+            except ProviderConfigError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('generate_fortunes'))
+
+            today = datetime.now(timezone.utc).date()
+            try:
+                # All twelve signs are fetched concurrently
+                responses = await asyncio.gather(*(provider.afetch(sign, today) for sign in ZODIAC_SIGNS))
+                await db_session.run_sync(lambda sync_session: store_daily_fortunes(
+                    sync_session, today, dict(zip(ZODIAC_SIGNS, responses))))
+                flash('Daily fortunes have been generated successfully!', 'success')
+            except Exception as e:
+                await db_session.rollback()
+                logger.error(f"Error generating fortunes: {e}")
+                flash(f'Error generating fortunes: {str(e)}', 'danger')
+
+        return redirect(url_for('generate_fortunes'))
+
+
+application = AsyncFortuneApp(app)
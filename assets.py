@@ -0,0 +1,214 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`flask build-assets` copies everything under static/ into static/dist/ with a
+content hash in the file name, writes gzip and brotli variants of text
+assets, produces resized PNG and WebP versions of raster images, rewrites
+/static/ references inside CSS to the hashed names, and records the mapping
+in static/dist/manifest.json.
+
+At runtime url_for('static', filename=...) resolves through the manifest, and
+hashed files are served with far-future immutable cache headers, using the
+precompressed variant the client accepts. Without a manifest everything falls
+back to Flask's normal static handling.
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional: brotli variants are skipped without it
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:  # optional: image variants are skipped without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+RESIZABLE = {'.png', '.jpg', '.jpeg'}
+# Widths for image variants; the moon is shown at up to 500px, so 1x and 2x
+IMAGE_WIDTHS = (500, 1000)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)/static/([^'")]+)\1\s*\)""")
+_CSS_BACKGROUND = re.compile(r"""(background(?:-image)?\s*:[^;{}]*?url\(\s*['"]?/static/([^'")]+)['"]?\s*\)[^;{}]*;)""")
+
+
+def _hashed_name(relative_path, data):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem, ext = os.path.splitext(relative_path)
+    return f"{stem}.{digest}{ext}"
+
+
+def _write(dist_root, relative_path, data):
+    path = os.path.join(dist_root, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    ext = os.path.splitext(relative_path)[1].lower()
+    if ext in COMPRESSIBLE:
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+
+
+def _add(manifest, dist_root, logical_name, data):
+    hashed = _hashed_name(logical_name, data)
+    _write(dist_root, hashed, data)
+    manifest[logical_name] = f"{DIST_DIR}/{hashed}"
+
+
+def _image_variants(manifest, dist_root, relative_path, source_path):
+    """Write resized PNG/JPEG and WebP versions of a raster image"""
+    if Image is None:
+        logger.warning("Pillow not installed, skipping image variants")
+        return
+
+    stem, ext = os.path.splitext(relative_path)
+    with Image.open(source_path) as image:
+        image.load()
+        targets = [(width, f"{stem}-{width}") for width in IMAGE_WIDTHS if width < image.width]
+        targets.append((image.width, stem))
+        for width, name in targets:
+            height = round(image.height * width / image.width)
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            if name != stem:
+                buffer = io.BytesIO()
+                resized.save(buffer, format=image.format, optimize=True)
+                _add(manifest, dist_root, name + ext, buffer.getvalue())
+            buffer = io.BytesIO()
+            resized.save(buffer, format='WEBP', quality=85, method=6)
+            _add(manifest, dist_root, name + '.webp', buffer.getvalue())
+
+
+def _image_set(manifest, relative_path):
+    """CSS image-set() preferring WebP at 1x/2x for an image with variants, or None"""
+    stem, ext = os.path.splitext(relative_path)
+    one_x, two_x = (f"{stem}-{width}" for width in IMAGE_WIDTHS)
+    if f"{one_x}.webp" not in manifest or f"{two_x}{ext}" not in manifest:
+        return None
+    candidates = [
+        (f"{one_x}.webp", 'image/webp', '1x'),
+        (f"{two_x}.webp", 'image/webp', '2x'),
+        (f"{one_x}{ext}", mimetypes.guess_type(relative_path)[0], '1x'),
+        (f"{two_x}{ext}", mimetypes.guess_type(relative_path)[0], '2x'),
+    ]
+    return 'image-set(' + ', '.join(
+        f'url("/static/{manifest[name]}") type("{mime}") {density}' for name, mime, density in candidates
+    ) + ')'
+
+
+def _rewrite_css(css, manifest):
+    def add_image_set(match):
+        declaration, path = match.group(1), match.group(2)
+        image_set = _image_set(manifest, path)
+        if image_set is None:
+            return declaration
+        return f"{declaration}\n    background-image: {image_set};"
+
+    def hashed_url(match):
+        path = match.group(2)
+        return f"url('/static/{manifest.get(path, path)}')"
+
+    css = _CSS_BACKGROUND.sub(add_image_set, css)
+    return _CSS_URL.sub(hashed_url, css)
+
+
+def build_assets(static_folder):
+    """
+    Build static/dist and its manifest
+
+    Args:
+        static_folder (str): The app's static folder
+
+    Returns:
+        dict: The manifest, mapping logical names to dist paths
+    """
+    dist_root = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist_root, ignore_errors=True)
+    os.makedirs(dist_root)
+
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_root]
+        for filename in files:
+            path = os.path.join(root, filename)
+            sources.append((os.path.relpath(path, static_folder).replace(os.sep, '/'), path))
+
+    manifest = {}
+    # CSS goes last so the references it contains can be rewritten to hashed names
+    for relative_path, path in sorted(sources, key=lambda item: item[0].endswith('.css')):
+        with open(path, 'rb') as f:
+            data = f.read()
+        ext = os.path.splitext(relative_path)[1].lower()
+        if ext == '.css':
+            data = _rewrite_css(data.decode('utf-8'), manifest).encode('utf-8')
+        _add(manifest, dist_root, relative_path, data)
+        if ext in RESIZABLE:
+            _image_variants(manifest, dist_root, relative_path, path)
+
+    with open(os.path.join(dist_root, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    """Read static/dist/manifest.json, or return an empty manifest if it has not been built"""
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _send_static(filename):
+    """Static view: hashed files get immutable caching and precompressed variants"""
+    app = current_app
+    if not filename.startswith(DIST_DIR + '/'):
+        return app.send_static_file(filename)
+
+    accepted = request.accept_encodings
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[encoding] and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+            response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype, max_age=31536000)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(app.static_folder, filename, max_age=31536000)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Resolve url_for('static') through the manifest and serve hashed files"""
+    manifest = load_manifest(app.static_folder)
+    app.extensions['asset_manifest'] = manifest
+    if not manifest:
+        return
+    logger.info(f"Serving {len(manifest)} fingerprinted static assets")
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = manifest.get(values['filename'], values['filename'])
+
+    app.view_functions['static'] = _send_static
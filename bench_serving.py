@@ -0,0 +1,230 @@
+"""
+Side-by-side benchmark of the gunicorn sync deployment and the ASGI mode.
+
+    python bench_serving.py --users 200 --openai-latency 1.0
+
+Both servers run against the same throwaway database. OpenAI is replaced by a
+local stub that answers after a fixed delay (OPENAI_BASE_URL), and horoscopes
+come from replay mode, so the run needs no network and no API keys. Each
+user has a pre-signed session cookie and requests /daily_fortune once with
+no fortune for today yet. That means every request does a full generation:
+database reads, one OpenAI call and the writes. --path /api/v1/fortune/today
+does the same work through a route the ASGI mode leaves to its Flask thread
+pool, which shows how that fallback holds up under the same load.
+
+Pass --database-url to benchmark against PostgreSQL instead of SQLite; the
+asgi side then needs asyncpg. Needs the packages in requirements-async.txt.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+import httpx
+
+STUB_LATENCY_ENV = 'BENCH_OPENAI_LATENCY'
+
+
+async def openai_stub(scope, receive, send):
+    """Minimal chat completions endpoint that answers after BENCH_OPENAI_LATENCY seconds"""
+    if scope['type'] != 'http':
+        return
+    while (await receive()).get('more_body'):
+        pass
+    await asyncio.sleep(float(os.getenv(STUB_LATENCY_ENV, '1.0')))
+    body = json.dumps({
+        'id': 'chatcmpl-bench',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': 'gpt-3.5-turbo',
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': 'The stars favour patient benchmarks today.'},
+            'finish_reason': 'stop',
+        }],
+        'usage': {'prompt_tokens': 120, 'completion_tokens': 30, 'total_tokens': 150},
+    }).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def prepare_database(users):
+    """Create the schema and `users` accounts; returns a signed session cookie per user"""
+    from flask_bcrypt import Bcrypt
+
+    from app import app
+    from models import db, User
+
+    # One hash for everyone; bcrypt is not what is being measured
+    password = Bcrypt(app).generate_password_hash('benchmark-password').decode('utf-8')
+    serializer = app.session_interface.get_signing_serializer(app)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        accounts = [
+            User(name=f'Bench User {index}', birthday=date(1990, 1 + index % 12, 1 + index % 28),
+                 username=f'bench{index}', email=f'bench{index}@example.com', password=password,
+                 mbti='INTJ', chinese_zodiac='Horse')
+            for index in range(users)
+        ]
+        db.session.add_all(accounts)
+        db.session.commit()
+        return [
+            serializer.dumps({'user_id': user.id, 'username': user.username, 'role': user.role,
+                              'is_admin': False, 'auth_version': user.auth_version})
+            for user in accounts
+        ]
+
+
+def reset_fortunes():
+    """Forget today's fortunes so the next run generates them again"""
+    from app import app
+    from models import db, CohortStat, User, UserFortune
+
+    with app.app_context():
+        db.session.query(UserFortune).delete()
+        db.session.query(CohortStat).delete()
+        db.session.query(User).update({User.last_fortune: None, User.last_fortune_date: None})
+        db.session.commit()
+
+
+def wait_until_up(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not come up")
+
+
+async def load(base_url, path, cookies, concurrency, cookie_name):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(client, cookie):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.get(path, headers={'Cookie': f'{cookie_name}={cookie}'})
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, cookie) for cookie in cookies))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, errors
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_server(name, command, env, port, path, cookies, concurrency, cookie_name):
+    reset_fortunes()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_until_up(f'{base_url}/healthz', process)
+        elapsed, latencies, errors = asyncio.run(load(base_url, path, cookies, concurrency, cookie_name))
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        'server': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200, help='Concurrent users, one request each')
+    parser.add_argument('--concurrency', type=int, default=None, help='In-flight requests (default: --users)')
+    parser.add_argument('--openai-latency', type=float, default=1.0, help='Seconds the OpenAI stub waits')
+    parser.add_argument('--gunicorn-workers', type=int, default=4)
+    parser.add_argument('--uvicorn-workers', type=int, default=1)
+    parser.add_argument('--path', default='/daily_fortune', help='Route each user requests')
+    parser.add_argument('--database-url', help='Defaults to a temporary SQLite file')
+    parser.add_argument('--port', type=int, default=8100, help='First of three consecutive ports')
+    args = parser.parse_args()
+    concurrency = args.concurrency or args.users
+
+    workdir = tempfile.mkdtemp(prefix='fortune-bench-')
+    stub_port, sync_port, async_port = args.port, args.port + 1, args.port + 2
+    env = dict(
+        os.environ,
+        SECRET_KEY='benchmark-secret',
+        OPENAI_API_KEY='benchmark',
+        OPENAI_BASE_URL=f'http://127.0.0.1:{stub_port}/v1',
+        OPENAI_RPM='1000000',
+        OPENAI_TPM='1000000000',
+        OPENAI_INTERACTIVE_TIMEOUT='60',
+        HOROSCOPE_PROVIDER_MODE='replay',
+        HOROSCOPE_CASSETTE_DIR=os.path.join(workdir, 'cassettes'),
+        SLOW_REQUEST_THRESHOLD_MS='1000000',
+        **{STUB_LATENCY_ENV: str(args.openai_latency)},
+    )
+    if args.database_url:
+        env['DATABASE_URL'] = args.database_url
+    else:
+        env.pop('DATABASE_URL', None)
+        env['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    # The app module reads its configuration at import time
+    os.environ.clear()
+    os.environ.update(env)
+    from app import app
+    cookies = prepare_database(args.users)
+    cookie_name = app.config['SESSION_COOKIE_NAME']
+
+    stub = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'bench_serving:openai_stub', '--port', str(stub_port),
+         '--log-level', 'warning'],
+        env=env,
+    )
+    try:
+        results = [
+            run_server('gunicorn sync', [sys.executable, '-m', 'gunicorn', 'app:app', '-w', str(args.gunicorn_workers),
+                                         '-b', f'127.0.0.1:{sync_port}', '--timeout', '300'],
+                       env, sync_port, args.path, cookies, concurrency, cookie_name),
+            run_server('uvicorn asgi', [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(async_port),
+                                        '--workers', str(args.uvicorn_workers), '--log-level', 'warning'],
+                       env, async_port, args.path, cookies, concurrency, cookie_name),
+        ]
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print(f"{args.path}: {args.users} users, {concurrency} in flight, OpenAI latency {args.openai_latency}s")
+    print(f"{'server':<14}{'requests':>9}{'errors':>8}{'seconds':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for result in results:
+        print(f"{result['server']:<14}{result['requests']:>9}{result['errors']:>8}{result['seconds']:>9.2f}"
+              f"{result['rps']:>9.1f}{result['p50_ms']:>9.0f}{result['p95_ms']:>9.0f}{result['p99_ms']:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
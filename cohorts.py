@@ -0,0 +1,175 @@
+"""
+Materialized cohort statistics.
+
+CohortStat holds user counts by sun sign, MBTI type, Chinese zodiac and
+daily activity ('active_date' rows, one per day, counting users who got a
+fortune that day). Signup, account edits and fortune generation adjust the
+counts incrementally in the same transaction as the change, so the admin
+analytics page reads a few dozen rows no matter how many users there are.
+`flask rebuild-cohorts` recomputes everything with set-based SQL; the release
+step runs it with --if-empty so a fresh deploy starts from the real counts.
+"""
+from sqlalchemy import String, case, cast, delete, extract, func, insert, literal, select, and_, or_
+
+from models import CohortStat, User
+from seed_utils import dialect_insert
+
+UNKNOWN = 'unknown'
+DIMENSIONS = ('sun_sign', 'mbti', 'chinese_zodiac')
+
+# (sign, first month, first day); each sign runs until the next one starts
+SUN_SIGN_STARTS = [
+    ('capricorn', 12, 22), ('aquarius', 1, 20), ('pisces', 2, 19), ('aries', 3, 21),
+    ('taurus', 4, 20), ('gemini', 5, 21), ('cancer', 6, 21), ('leo', 7, 23),
+    ('virgo', 8, 23), ('libra', 9, 23), ('scorpio', 10, 23), ('sagittarius', 11, 22),
+]
+
+
+def user_cohorts(sun_sign, mbti, chinese_zodiac):
+    """Cohort values for one user, as {dimension: value}"""
+    return {
+        'sun_sign': sun_sign or UNKNOWN,
+        'mbti': mbti or UNKNOWN,
+        'chinese_zodiac': chinese_zodiac or UNKNOWN,
+    }
+
+
+def sun_sign(day, month):
+    """Sun sign for a birth day and month, matching the SQL used by rebuild() (app.get_zodiac_sign uses it too)"""
+    for index, (sign, start_month, start_day) in enumerate(SUN_SIGN_STARTS):
+        _, end_month, end_day = SUN_SIGN_STARTS[(index + 1) % len(SUN_SIGN_STARTS)]
+        if (month == start_month and day >= start_day) or (month == end_month and day < end_day):
+            return sign
+    return UNKNOWN
+
+
+def _adjust(session, deltas):
+    """Add each delta to its (dimension, value) counter"""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    rows = [{'dimension': dimension, 'value': value, 'count': delta} for (dimension, value), delta in deltas.items()]
+    insert_stmt = dialect_insert(session.get_bind(CohortStat).dialect.name)
+    if insert_stmt is not None:
+        stmt = insert_stmt(CohortStat.__table__).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['dimension', 'value'],
+            set_={'count': CohortStat.__table__.c.count + stmt.excluded['count']},
+        )
+        session.execute(stmt)
+        return
+
+    for row in rows:
+        stat = session.get(CohortStat, (row['dimension'], row['value']), with_for_update=True)
+        if stat is None:
+            session.add(CohortStat(**row))
+        else:
+            stat.count += row['count']
+
+
+def record_user_change(session, old=None, new=None):
+    """
+    Move a user between cohorts (call in the same transaction as the change)
+
+    Args:
+        session: SQLAlchemy session
+        old (dict): Cohorts before the change, None for a new user
+        new (dict): Cohorts after the change, None for a deleted user
+    """
+    deltas = {}
+    for cohorts, sign in ((old, -1), (new, 1)):
+        for dimension, value in (cohorts or {}).items():
+            key = (dimension, value)
+            deltas[key] = deltas.get(key, 0) + sign
+    _adjust(session, deltas)
+
+
+def record_new_users(session, new_cohorts):
+    """Count a batch of new users with a single upsert (same transaction as the inserts)"""
+    deltas = {}
+    for cohorts in new_cohorts:
+        for key in cohorts.items():
+            deltas[key] = deltas.get(key, 0) + 1
+    _adjust(session, deltas)
+
+
+def record_active(session, day):
+    """Count one more user as active on `day`"""
+    _adjust(session, {('active_date', day.isoformat()): 1})
+
+
+def _sun_sign_expression():
+    month = extract('month', User.birthday)
+    day = extract('day', User.birthday)
+    whens = []
+    for index, (sign, start_month, start_day) in enumerate(SUN_SIGN_STARTS):
+        _, end_month, end_day = SUN_SIGN_STARTS[(index + 1) % len(SUN_SIGN_STARTS)]
+        whens.append((or_(
+            and_(month == start_month, day >= start_day),
+            and_(month == end_month, day < end_day),
+        ), sign))
+    return case(*whens, else_=UNKNOWN)
+
+
+def rebuild(session):
+    """Recompute every cohort count from the User table in one transaction"""
+    columns = ['dimension', 'value', 'count']
+    sources = {
+        'sun_sign': _sun_sign_expression(),
+        'mbti': func.coalesce(func.nullif(User.mbti, ''), UNKNOWN),
+        'chinese_zodiac': func.coalesce(func.nullif(User.chinese_zodiac, ''), UNKNOWN),
+    }
+    try:
+        session.execute(delete(CohortStat))
+        for dimension, expression in sources.items():
+            session.execute(insert(CohortStat).from_select(
+                columns,
+                select(literal(dimension), expression, func.count()).select_from(User).group_by(expression),
+            ))
+        # Only each user's latest active day is known, so history is approximate
+        # after a rebuild; today's count is exact.
+        active_day = User.last_fortune_date
+        session.execute(insert(CohortStat).from_select(
+            columns,
+            select(literal('active_date'), cast(active_day, String), func.count())
+            .where(active_day.isnot(None))
+            .group_by(active_day),
+        ))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+
+def rebuild_if_empty(session):
+    """Rebuild when no counters exist yet (fresh deploy or upgrade); returns True if it did"""
+    if session.scalar(select(CohortStat.dimension).limit(1)) is not None:
+        return False
+    rebuild(session)
+    return True
+
+
+def summary(session, today):
+    """
+    Cohort counts for the analytics page
+
+    Returns:
+        dict: {'total': int, 'active_today': int, dimension: [(value, count), ...]}
+    """
+    stats = session.execute(
+        select(CohortStat.dimension, CohortStat.value, CohortStat.count)
+        .where(or_(CohortStat.dimension.in_(DIMENSIONS),
+                   and_(CohortStat.dimension == 'active_date', CohortStat.value == today.isoformat())))
+    ).all()
+    result = {dimension: [] for dimension in DIMENSIONS}
+    active_today = 0
+    for dimension, value, count in stats:
+        if dimension == 'active_date':
+            active_today = count
+        elif count:
+            result[dimension].append((value, count))
+    for dimension in DIMENSIONS:
+        result[dimension].sort(key=lambda item: (-item[1], item[0]))
+    result['total'] = sum(count for _, count in result['sun_sign'])
+    result['active_today'] = active_today
+    return result
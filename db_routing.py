@@ -0,0 +1,122 @@
+"""
+Read-replica routing for db.session.
+
+When DATABASE_REPLICA_URL is set a separate engine is created for it, and
+RoutingSession sends plain SELECTs there. It is deliberately not a
+Flask-SQLAlchemy bind, so create_all() and drop_all() never touch it.
+Everything else goes to the primary: flushes and other writes,
+SELECT ... FOR UPDATE, and every read that follows a write in the same
+session (i.e. the same request). After a
+commit the client's next few requests also stay on the primary, so a user
+never reads their own write from a lagging replica.
+
+The replica is probed periodically and after connection errors; while it is
+unhealthy all reads fall back to the primary.
+"""
+import logging
+import os
+import threading
+import time
+
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+REPLICA_EXTENSION = 'db_replica'
+# How long a client keeps reading from the primary after it wrote something
+STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '10'))
+STICKY_SESSION_KEY = '_primary_until'
+
+
+class ReplicaHealth:
+    """Tracks whether the replica engine is usable, re-probing at most every CHECK_INTERVAL"""
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.healthy = True
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def mark_unhealthy(self):
+        if self.healthy:
+            logger.warning("Read replica marked unhealthy, routing reads to the primary")
+        self.healthy = False
+        self._checked_at = time.monotonic()
+
+    def is_healthy(self, engine):
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return self.healthy
+        # One request re-probes; the rest use the last known state meanwhile
+        if not self._lock.acquire(blocking=False):
+            return self.healthy
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            if not self.healthy:
+                logger.info("Read replica healthy again")
+            self.healthy = True
+            self._checked_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Read replica health check failed: {e}")
+            self.mark_unhealthy()
+        finally:
+            self._lock.release()
+        return self.healthy
+
+
+replica_health = ReplicaHealth()
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends read-only queries to the replica engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if isinstance(clause, Select) and clause._for_update_arg is None and not self._flushing:
+                replica = self._replica_engine()
+                if replica is not None:
+                    return replica
+            else:
+                # Flushes, DML and raw SQL: everything after this reads the primary
+                self.info['wrote'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_engine(self):
+        if self.info.get('wrote'):
+            return None
+        engine = current_app.extensions.get(REPLICA_EXTENSION)
+        if engine is None:
+            return None
+        if has_request_context() and flask_session.get(STICKY_SESSION_KEY, 0) > time.time():
+            return None
+        if not replica_health.is_healthy(engine):
+            return None
+        return engine
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    if session.info.get('wrote') and has_request_context() and REPLICA_EXTENSION in current_app.extensions:
+        flask_session[STICKY_SESSION_KEY] = time.time() + STICKY_SECONDS
+
+
+def init_replica(app, replica_url):
+    """Create the replica engine for this app, if a replica URL is configured"""
+    if not replica_url:
+        return None
+    if replica_url.startswith('postgres://'):
+        replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+    engine = create_engine(replica_url, pool_pre_ping=True)
+
+    @event.listens_for(engine, 'handle_error')
+    def _replica_error(context):
+        # Mark the replica unhealthy as soon as a query on it loses its connection
+        if context.is_disconnect or context.connection is None:
+            replica_health.mark_unhealthy()
+
+    app.extensions[REPLICA_EXTENSION] = engine
+    return engine
@@ -1,6 +1,8 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, DateField, SelectField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, Optional, ValidationError
+from sqlalchemy import select
+from models import db, User
 
 mbti_choices = [
     ('', 'Select MBTI Type'),
@@ -20,6 +22,16 @@ class RegistrationForm(FlaskForm):
     mbti = SelectField('MBTI Type', choices=mbti_choices, validators=[Optional()])
     submit = SubmitField('Sign Up')
 
+    # Existence probes answered from the unique indexes; signup still handles
+    # the IntegrityError if a concurrent signup takes the name first
+    def validate_username(self, username):
+        if db.session.scalar(select(select(User.id).where(User.username == username.data).exists())):
+            raise ValidationError('That username is already taken. Please choose another one.')
+
+    def validate_email(self, email):
+        if db.session.scalar(select(select(User.id).where(User.email == email.data).exists())):
+            raise ValidationError('An account with that email already exists.')
+
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=2, max=20)])
     password = PasswordField('Password', validators=[DataRequired()])
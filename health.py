@@ -0,0 +1,101 @@
+"""
+Readiness checks for /readyz.
+
+The database probe runs on a helper thread with a short timeout so a wedged
+connection pool shows up as "not ready" instead of hanging the health probe,
+and the whole report is cached for a few seconds so frequent probes cost
+next to nothing.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select, text
+
+from models import db, DailyFortune
+
+ZODIAC_SIGN_COUNT = 12
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='readyz')
+_lock = threading.Lock()
+_cached = (0.0, None)
+
+
+def pool_status(engine):
+    """Connection pool usage, for pools that expose it"""
+    pool = engine.pool
+    status = {'class': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    return status
+
+
+def _probe_database(app):
+    with app.app_context():
+        started = time.perf_counter()
+        with db.engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+            today = datetime.now(timezone.utc).date()
+            latest, signs_today = connection.execute(
+                select(
+                    func.max(DailyFortune.date),
+                    select(func.count(func.distinct(DailyFortune.zodiac_sign)))
+                    .where(DailyFortune.date == today)
+                    .scalar_subquery(),
+                )
+            ).one()
+        return {
+            'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+            'fortunes': {
+                'latest_date': latest.isoformat() if latest else None,
+                'signs_today': signs_today,
+                'fresh': signs_today >= ZODIAC_SIGN_COUNT,
+            },
+        }
+
+
+def readiness(app, limiter, openai_configured, timeout=1.0, cache_seconds=5.0):
+    """
+    Build the readiness report, reusing a recent one if available
+
+    Args:
+        app: Flask application
+        limiter: The shared OpenAIRateLimiter
+        openai_configured (bool): Whether an OpenAI client exists
+        timeout (float): Seconds to wait for the database probe
+        cache_seconds (float): How long a report is reused
+
+    Returns:
+        tuple: (report dict, ready bool)
+    """
+    global _cached
+    now = time.monotonic()
+    checked_at, cached = _cached
+    if cached is not None and now - checked_at < cache_seconds:
+        return cached
+
+    with _lock:
+        checked_at, cached = _cached
+        if cached is not None and time.monotonic() - checked_at < cache_seconds:
+            return cached
+
+        report = {
+            'openai': {'configured': openai_configured, 'breaker': limiter.breaker_state},
+        }
+        future = _executor.submit(_probe_database, app)
+        try:
+            report['database'] = {'ok': True, **future.result(timeout=timeout)}
+        except TimeoutError:
+            report['database'] = {'ok': False, 'error': f'timed out after {timeout}s'}
+        except Exception as e:
+            report['database'] = {'ok': False, 'error': type(e).__name__}
+        with app.app_context():
+            report['database']['pool'] = pool_status(db.engine)
+
+        ready = report['database']['ok']
+        report['status'] = 'ready' if ready else 'unavailable'
+        _cached = (time.monotonic(), (report, ready))
+        return report, ready
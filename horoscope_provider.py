@@ -0,0 +1,316 @@
+"""
+Horoscope provider used by the generate_fortunes route.
+
+RapidAPIHoroscopeProvider talks to the horoscope-astrology API. It can be
+wrapped in a CachingHoroscopeProvider, which keeps responses on disk keyed by
+(sign, day) and honors the upstream Cache-Control/Expires headers, so
+fetching the same day twice costs no quota. Stale entries are revalidated
+with If-None-Match/If-Modified-Since when the upstream sent validators.
+The cache lives on the web instance's own disk, so the provider itself drops
+the directories of past days (prune_cache) whenever it starts a new day.
+HOROSCOPE_PROVIDER_MODE selects how the provider is assembled:
+
+    live    - cached RapidAPI calls (default)
+    record  - like live, and every response (cached or not) is also saved as a cassette
+    replay  - serve saved cassettes only; no network and no API key needed
+
+Replay ignores the day, so tests and benchmarks see the same data every run.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from request_profiler import upstream_call
+
+logger = logging.getLogger(__name__)
+
+RAPIDAPI_HOST = 'horoscope-astrology.p.rapidapi.com'
+RAPIDAPI_URL = f'https://{RAPIDAPI_HOST}/horoscope'
+DEFAULT_FORTUNE = 'No fortune available today.'
+
+_MAX_AGE = re.compile(r'(?:s-maxage|max-age)\s*=\s*(\d+)')
+
+
+class ProviderConfigError(Exception):
+    """The provider cannot be used with the current configuration"""
+
+
+class HoroscopeResponse:
+    """The parts of an upstream response worth caching"""
+
+    def __init__(self, status_code, body, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {key.lower(): value for key, value in (headers or {}).items()}
+
+    @property
+    def horoscope(self):
+        if self.status_code != 200 or not isinstance(self.body, dict):
+            return None
+        return self.body.get('horoscope', DEFAULT_FORTUNE)
+
+    def to_dict(self):
+        return {'status_code': self.status_code, 'body': self.body, 'headers': self.headers}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['status_code'], data['body'], data.get('headers'))
+
+
+class HoroscopeProvider:
+    """
+    Base class: fetch(sign, day) returns a HoroscopeResponse, afetch() is its coroutine twin
+
+    `validators` are conditional request headers (If-None-Match,
+    If-Modified-Since) for revalidating a cached response; a provider that
+    honors them may answer 304 with no body.
+    """
+
+    def fetch(self, sign, day, validators=None):
+        raise NotImplementedError
+
+    async def afetch(self, sign, day, validators=None):
+        # fetch() may block, so it runs off the event loop
+        return await asyncio.to_thread(self.fetch, sign, day, validators)
+
+
+class RapidAPIHoroscopeProvider(HoroscopeProvider):
+    def __init__(self, api_key, timeout=10, http=None, async_http=None):
+        """
+        Args:
+            api_key (str): RapidAPI key
+            timeout (float): Request timeout in seconds
+            http (requests.Session): Session for fetch()
+            async_http (httpx.AsyncClient): Shared client for afetch() (ASGI mode only)
+        """
+        if not api_key:
+            raise ProviderConfigError('RapidAPI key is missing. Please configure the RAPIDAPI_KEY environment variable.')
+        self.timeout = timeout
+        self.headers = {'x-rapidapi-host': RAPIDAPI_HOST, 'x-rapidapi-key': api_key}
+        self.http = http or requests.Session()
+        self.http.headers.update(self.headers)
+        self.async_http = async_http
+
+    def fetch(self, sign, day, validators=None):
+        # The API only serves the current day; `day` is used for cache keys
+        with upstream_call('rapidapi'):
+            response = self.http.get(RAPIDAPI_URL, params={'day': 'today', 'sunsign': sign},
+                                     headers=validators, timeout=self.timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return HoroscopeResponse(response.status_code, body, dict(response.headers))
+
+    async def afetch(self, sign, day, validators=None):
+        if self.async_http is None:
+            raise ProviderConfigError('afetch() needs an httpx.AsyncClient')
+        with upstream_call('rapidapi'):
+            response = await self.async_http.get(RAPIDAPI_URL, params={'day': 'today', 'sunsign': sign},
+                                                 headers={**self.headers, **(validators or {})},
+                                                 timeout=self.timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return HoroscopeResponse(response.status_code, body, dict(response.headers))
+
+
+def _write_json(path, data):
+    """Write atomically so concurrent workers never read a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def expires_at(response, day, now):
+    """
+    Epoch seconds until which a response may be reused, or None if it must not be stored
+
+    Only no-store keeps a response out of the cache. no-cache responses expire
+    at once, so they are stored but revalidated before every reuse; private is
+    ignored because this cache belongs to the app, not a shared proxy.
+    Explicit max-age/Expires headers win; otherwise a successful response is
+    good until the end of its day (UTC).
+    """
+    if response.status_code != 200:
+        return None
+    cache_control = response.headers.get('cache-control', '').lower()
+    if 'no-store' in cache_control:
+        return None
+    if 'no-cache' in cache_control:
+        return now
+    match = _MAX_AGE.search(cache_control)
+    if match:
+        return now + int(match.group(1))
+    if 'expires' in response.headers:
+        try:
+            return parsedate_to_datetime(response.headers['expires']).timestamp()
+        except (TypeError, ValueError):
+            return None
+    end_of_day = datetime.combine(day + timedelta(days=1), dt_time.min, tzinfo=timezone.utc)
+    return end_of_day.timestamp()
+
+
+def _validators(entry):
+    """Conditional request headers for revalidating a stale cache entry, or None"""
+    if not entry:
+        return None
+    headers = entry['response'].get('headers') or {}
+    validators = {}
+    if 'etag' in headers:
+        validators['If-None-Match'] = headers['etag']
+    if 'last-modified' in headers:
+        validators['If-Modified-Since'] = headers['last-modified']
+    return validators or None
+
+
+class CachingHoroscopeProvider(HoroscopeProvider):
+    """Persistent (sign, day) cache in front of another provider"""
+
+    def __init__(self, inner, cache_dir, keep_days=None):
+        """
+        Args:
+            inner (HoroscopeProvider): Provider asked on a miss or for revalidation
+            cache_dir (str): Directory holding one subdirectory per day
+            keep_days (int): Prune days older than this when a new day is first cached; None keeps everything
+        """
+        self.inner = inner
+        self.cache_dir = cache_dir
+        self.keep_days = keep_days
+
+    def _path(self, sign, day):
+        return os.path.join(self.cache_dir, day.isoformat(), f'{sign}.json')
+
+    def fetch(self, sign, day, validators=None):
+        path = self._path(sign, day)
+        now = time.time()
+        entry = _read_json(path)
+        if entry and entry['expires_at'] > now:
+            return HoroscopeResponse.from_dict(entry['response'])
+
+        response = self.inner.fetch(sign, day, _validators(entry))
+        return self._store(path, entry, response, day, now)
+
+    async def afetch(self, sign, day, validators=None):
+        path = self._path(sign, day)
+        now = time.time()
+        entry = _read_json(path)
+        if entry and entry['expires_at'] > now:
+            return HoroscopeResponse.from_dict(entry['response'])
+
+        response = await self.inner.afetch(sign, day, _validators(entry))
+        return self._store(path, entry, response, day, now)
+
+    def _store(self, path, entry, response, day, now):
+        """Cache the upstream response (a 304 refreshes `entry`) and return what the caller should see"""
+        if response.status_code == 304 and entry:
+            cached = HoroscopeResponse.from_dict(entry['response'])
+            response = HoroscopeResponse(cached.status_code, cached.body, {**cached.headers, **response.headers})
+        expiry = expires_at(response, day, now)
+        if expiry is not None:
+            new_day = not os.path.isdir(os.path.dirname(path))
+            _write_json(path, {'expires_at': expiry, 'response': response.to_dict()})
+            if new_day and self.keep_days is not None:
+                removed = prune_cache(self.cache_dir, day, self.keep_days)
+                if removed:
+                    logger.info(f"Removed {removed} horoscope cache days from {self.cache_dir}")
+        return response
+
+
+def prune_cache(cache_dir, today, keep_days):
+    """
+    Delete the cache directories of days more than `keep_days` before `today`
+
+    Returns:
+        int: Number of day directories removed
+    """
+    cutoff = today - timedelta(days=keep_days)
+    try:
+        names = os.listdir(cache_dir)
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for name in names:
+        try:
+            day = date.fromisoformat(name)
+        except ValueError:
+            continue
+        if day < cutoff:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+class RecordingHoroscopeProvider(HoroscopeProvider):
+    """Saves every response from the wrapped provider as a cassette"""
+
+    def __init__(self, inner, cassette_dir):
+        self.inner = inner
+        self.cassette_dir = cassette_dir
+
+    def fetch(self, sign, day, validators=None):
+        response = self.inner.fetch(sign, day, validators)
+        self._record(sign, day, response)
+        return response
+
+    async def afetch(self, sign, day, validators=None):
+        response = await self.inner.afetch(sign, day, validators)
+        self._record(sign, day, response)
+        return response
+
+    def _record(self, sign, day, response):
+        _write_json(os.path.join(self.cassette_dir, f'{sign}.json'),
+                    {'recorded_for': day.isoformat(), 'response': response.to_dict()})
+
+
+class ReplayHoroscopeProvider(HoroscopeProvider):
+    """Serves recorded cassettes without touching the network"""
+
+    def __init__(self, cassette_dir):
+        self.cassette_dir = cassette_dir
+
+    def fetch(self, sign, day, validators=None):
+        cassette = _read_json(os.path.join(self.cassette_dir, f'{sign}.json'))
+        if cassette is None:
+            logger.warning(f"No recorded horoscope for {sign} in {self.cassette_dir}")
+            return HoroscopeResponse(404, None)
+        return HoroscopeResponse.from_dict(cassette['response'])
+
+
+def build_provider(mode, api_key, cache_dir, cassette_dir, async_http=None, cache_keep_days=None):
+    """
+    Assemble the provider for a HOROSCOPE_PROVIDER_MODE
+
+    Raises:
+        ProviderConfigError: Unknown mode or missing API key
+    """
+    if mode == 'replay':
+        return ReplayHoroscopeProvider(cassette_dir)
+    if mode not in ('live', 'record'):
+        raise ProviderConfigError(f"Unknown HOROSCOPE_PROVIDER_MODE '{mode}'")
+    provider = CachingHoroscopeProvider(RapidAPIHoroscopeProvider(api_key, async_http=async_http), cache_dir,
+                                        keep_days=cache_keep_days)
+    if mode == 'record':
+        # Outside the cache, so responses served from disk are recorded too
+        provider = RecordingHoroscopeProvider(provider, cassette_dir)
+    return provider
@@ -0,0 +1,141 @@
+"""
+Session-carried identity.
+
+The signed session holds the user's id, role and auth_version, so login and
+admin checks normally need no database query at all. To notice role or
+password changes made elsewhere, each process remembers the current
+auth_version per user for AUTH_VERSION_TTL seconds (for at most
+AUTH_VERSION_CACHE_SIZE users) and re-reads just that column when the entry
+goes stale. Changes committed through db.session update the cache of the
+committing process right away, so there the TTL only matters for changes
+made by other workers. The full User row is only loaded when a
+view actually uses flask_login.current_user, and then at most once per
+request. For that to hold, app.py creates the LoginManager without its
+template context processor, which would otherwise load the user on every
+render_template() call.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect, select
+
+from db_routing import RoutingSession
+from models import db, User
+
+SESSION_KEYS = ('user_id', 'username', 'is_admin', 'role', 'auth_version')
+
+
+class AuthVersionCache:
+    """Per-process LRU cache of user_id -> auth_version"""
+
+    def __init__(self, ttl_seconds=30, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, db_session=None):
+        """Current auth_version and role for the user, or (None, None) if the user is gone"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[2] < self.ttl_seconds:
+                self._entries.move_to_end(user_id)
+                return entry[0], entry[1]
+        row = (db_session or db.session).execute(select(User.auth_version, User.role).where(User.id == user_id)).first()
+        if row is None:
+            self.forget(user_id)
+            return None, None
+        self._store(user_id, row.auth_version, row.role, now)
+        return row.auth_version, row.role
+
+    def set(self, user_id, auth_version, role):
+        self._store(user_id, auth_version, role, time.monotonic())
+
+    def forget(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, user_id, auth_version, role, now):
+        with self._lock:
+            self._entries[user_id] = (auth_version, role, now)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+auth_versions = AuthVersionCache(int(os.getenv('AUTH_VERSION_TTL', '30')),
+                                 int(os.getenv('AUTH_VERSION_CACHE_SIZE', '10000')))
+
+AUTH_CHANGES_KEY = 'auth_version_changes'
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_auth_changes(db_session, flush_context):
+    """Note users whose auth_version was bumped or who were deleted in this flush"""
+    changes = db_session.info.setdefault(AUTH_CHANGES_KEY, {})
+    for obj in db_session.dirty:
+        if isinstance(obj, User) and inspect(obj).attrs.auth_version.history.has_changes():
+            changes[obj.id] = (obj.auth_version, obj.role)
+    for obj in db_session.deleted:
+        if isinstance(obj, User):
+            changes[obj.id] = None
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _apply_auth_changes(db_session):
+    for user_id, change in db_session.info.pop(AUTH_CHANGES_KEY, {}).items():
+        if change is None:
+            auth_versions.forget(user_id)
+        else:
+            auth_versions.set(user_id, *change)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_auth_changes(db_session):
+    db_session.info.pop(AUTH_CHANGES_KEY, None)
+
+
+def remember_identity(session, user):
+    """Store the user's identity in the signed session"""
+    session['user_id'] = user.id
+    session['username'] = user.username
+    session['role'] = user.role
+    session['is_admin'] = (user.role == 'admin')
+    session['auth_version'] = user.auth_version
+    auth_versions.set(user.id, user.auth_version, user.role)
+
+
+def forget_identity(session):
+    for key in SESSION_KEYS:
+        session.pop(key, None)
+
+
+def session_is_current(session, db_session=None):
+    """
+    Check that the session's identity still matches the user's auth_version
+
+    Sessions created before auth_version existed are upgraded in place.
+
+    Args:
+        session: The Flask session
+        db_session: SQLAlchemy session for cache misses, defaults to db.session
+
+    Returns:
+        bool: False if the user no longer exists or their role or password changed
+    """
+    version, role = auth_versions.get(session['user_id'], db_session)
+    if version is None:
+        return False
+    if 'auth_version' not in session:
+        session['auth_version'] = version
+        session['role'] = role
+        session['is_admin'] = (role == 'admin')
+        return True
+    return session['auth_version'] == version
@@ -0,0 +1,137 @@
+"""
+Deterministic local fortune engine.
+
+Builds a fortune from a small phrase grammar filled in with the day's
+horoscope, the user's MBTI strengths and weaknesses and their Chinese zodiac
+fortune. The same (user, date) key always yields the same fortune, so the
+result is stable across page loads and workers without storing anything, and
+no network call is involved.
+"""
+import hashlib
+import random
+import re
+
+MAX_WORDS = 70
+
+OPENINGS = [
+    "The stars lean in your favor today.",
+    "Today carries a quiet kind of momentum.",
+    "A subtle shift in the sky colors your day.",
+    "The heavens are speaking plainly today.",
+    "Today opens like a door left slightly ajar.",
+    "The cosmos has set an interesting table for you.",
+]
+
+HOROSCOPE_LEADS = [
+    "{horoscope}",
+    "Your sign's message: {horoscope}",
+    "Above all, remember this: {horoscope}",
+]
+
+STRENGTH_PHRASES = [
+    "Lean on being {strength}; it will carry you further than you expect.",
+    "Your {strength} side is your best ally right now.",
+    "Being {strength} opens a door others will miss.",
+    "Trust the part of you that is {strength}.",
+]
+
+WEAKNESS_PHRASES = [
+    "Just watch for moments when you become {weakness}.",
+    "Guard against being {weakness} when the pressure rises.",
+    "If you catch yourself being {weakness}, pause and breathe.",
+    "Let go of feeling {weakness}; it costs more than it gives.",
+]
+
+ZODIAC_PHRASES = [
+    "Your Chinese zodiac adds: {zodiac}",
+    "From the Chinese zodiac: {zodiac}",
+    "The year ahead agrees: {zodiac}",
+]
+
+CLOSINGS = [
+    "Move gently and with purpose.",
+    "Small choices will matter most.",
+    "Let curiosity lead the way.",
+    "Tonight, reflect on what surprised you.",
+    "",
+]
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def _first_sentence(text, max_words):
+    """Return the first sentence of `text`, trimmed to at most `max_words` words"""
+    text = (text or '').strip()
+    if not text:
+        return ''
+    sentence = _SENTENCE_END.split(text, maxsplit=1)[0]
+    words = sentence.split()
+    if len(words) > max_words:
+        sentence = ' '.join(words[:max_words]).rstrip(',;:') + '...'
+    return sentence
+
+
+def _traits(text):
+    """Split a comma separated trait list into lower-case phrases"""
+    return [part.strip().rstrip('.').lower() for part in (text or '').split(',') if part.strip().rstrip('.')]
+
+
+def seed_for(*parts):
+    """Stable 64-bit seed for the given key parts (e.g. user id and date)"""
+    digest = hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def share_bucket(*parts):
+    """Map the key parts to a stable number in [0, 1) for traffic splitting"""
+    return seed_for('share', *parts) / float(1 << 64)
+
+
+def generate_local_fortune(seed_key, astrological_fortune, mbti_strengths, mbti_weaknesses, chinese_zodiac_fortune):
+    """
+    Generate a fortune locally without any network access
+
+    Inputs that are None or empty are left out rather than quoted.
+
+    Args:
+        seed_key (tuple): Values that identify the fortune, usually (user id, date)
+        astrological_fortune (str): Daily astrological fortune
+        mbti_strengths (str): MBTI personality strengths
+        mbti_weaknesses (str): MBTI personality weaknesses
+        chinese_zodiac_fortune (str): Chinese zodiac fortune
+
+    Returns:
+        str: Generated fortune of at most MAX_WORDS words
+    """
+    rng = random.Random(seed_for(*seed_key))
+
+    sentences = [rng.choice(OPENINGS)]
+
+    horoscope = _first_sentence(astrological_fortune, 30)
+    if horoscope:
+        sentences.append(rng.choice(HOROSCOPE_LEADS).format(horoscope=horoscope))
+
+    # Everything below is optional and may be dropped to fit the word budget
+    optional = []
+
+    strengths = _traits(mbti_strengths)
+    if strengths:
+        optional.append(rng.choice(STRENGTH_PHRASES).format(strength=rng.choice(strengths)))
+
+    weaknesses = _traits(mbti_weaknesses)
+    if weaknesses:
+        optional.append(rng.choice(WEAKNESS_PHRASES).format(weakness=rng.choice(weaknesses)))
+
+    zodiac = _first_sentence(chinese_zodiac_fortune, 18)
+    if zodiac:
+        optional.append(rng.choice(ZODIAC_PHRASES).format(zodiac=zodiac))
+
+    closing = rng.choice(CLOSINGS)
+    if closing:
+        optional.append(closing)
+
+    # The opening and the horoscope line (at most 9 + 34 words) always fit;
+    # optional sentences are dropped whole, last first, so nothing ends mid-sentence.
+    while optional and len(' '.join(sentences + optional).split()) > MAX_WORDS:
+        optional.pop()
+    return ' '.join(sentences + optional)
@@ -0,0 +1,79 @@
+"""Baseline schema: user, daily_fortune, mbti_trait, chinese_zodiac
+
+Revision ID: 0001_baseline
+Revises: 
+Create Date: 2026-10-19 09:00:00.000000
+
+Databases created by db.create_all() or init_db.py before migrations existed
+already have these tables; they are only created when missing, so
+`flask db upgrade` works on both fresh and existing databases.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not _has_table('user'):
+        op.create_table(
+            'user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=150), nullable=False),
+            sa.Column('birthday', sa.Date(), nullable=False),
+            sa.Column('username', sa.String(length=150), nullable=False),
+            sa.Column('email', sa.String(length=150), nullable=False),
+            sa.Column('password', sa.String(length=200), nullable=False),
+            sa.Column('mbti', sa.String(length=4), nullable=True),
+            sa.Column('chinese_zodiac', sa.String(length=20), nullable=True),
+            sa.Column('last_fortune', sa.Text(), nullable=True),
+            sa.Column('last_fortune_date', sa.Date(), nullable=True),
+            sa.Column('role', sa.String(length=20), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email'),
+            sa.UniqueConstraint('username'),
+        )
+    if not _has_table('daily_fortune'):
+        op.create_table(
+            'daily_fortune',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('zodiac_sign', sa.String(length=50), nullable=False),
+            sa.Column('date', sa.Date(), nullable=False),
+            sa.Column('fortune', sa.Text(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+    if not _has_table('mbti_trait'):
+        op.create_table(
+            'mbti_trait',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('type', sa.String(length=4), nullable=False),
+            sa.Column('strengths', sa.Text(), nullable=False),
+            sa.Column('weaknesses', sa.Text(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('type'),
+        )
+    if not _has_table('chinese_zodiac'):
+        op.create_table(
+            'chinese_zodiac',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('sign', sa.String(length=20), nullable=False),
+            sa.Column('yearly_fortune_2024', sa.Text(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('sign'),
+        )
+
+
+def downgrade():
+    op.drop_table('chinese_zodiac')
+    op.drop_table('mbti_trait')
+    op.drop_table('daily_fortune')
+    op.drop_table('user')
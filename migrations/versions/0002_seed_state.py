@@ -0,0 +1,39 @@
+"""Add seed_state for change detection in the reference seeders
+
+Revision ID: 0002_seed_state
+Revises: 0001_baseline
+Create Date: 2026-10-19 09:05:00.000000
+
+The content hash of the reference data each seeder last wrote.
+
+Skipped when the objects already exist, because SQLite and debug
+deployments may have created them with db.create_all().
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_seed_state'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not _has_table('seed_state'):
+        op.create_table(
+            'seed_state',
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('digest', sa.String(length=64), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('name'),
+        )
+
+
+def downgrade():
+    op.drop_table('seed_state')
@@ -0,0 +1,50 @@
+"""Key Chinese zodiac fortunes by (sign, year)
+
+Revision ID: 0003_chinese_zodiac_fortune
+Revises: 0002_seed_state
+Create Date: 2026-10-19 09:06:00.000000
+
+- new table: chinese_zodiac_fortune, unique on (sign, year)
+- chinese_zodiac.yearly_fortune_2024 becomes nullable (superseded by
+  chinese_zodiac_fortune)
+
+Skipped when the objects already exist, because SQLite and debug
+deployments may have created them with db.create_all().
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_chinese_zodiac_fortune'
+down_revision = '0002_seed_state'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    with op.batch_alter_table('chinese_zodiac') as batch_op:
+        batch_op.alter_column('yearly_fortune_2024', existing_type=sa.Text(), nullable=True)
+
+    if not _has_table('chinese_zodiac_fortune'):
+        op.create_table(
+            'chinese_zodiac_fortune',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('sign', sa.String(length=20), nullable=False),
+            sa.Column('year', sa.Integer(), nullable=False),
+            sa.Column('fortune', sa.Text(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('sign', 'year', name='uq_chinese_zodiac_fortune_sign_year'),
+        )
+        op.create_index('ix_chinese_zodiac_fortune_year', 'chinese_zodiac_fortune', ['year'])
+
+
+def downgrade():
+    op.drop_index('ix_chinese_zodiac_fortune_year', table_name='chinese_zodiac_fortune')
+    op.drop_table('chinese_zodiac_fortune')
+    with op.batch_alter_table('chinese_zodiac') as batch_op:
+        batch_op.alter_column('yearly_fortune_2024', existing_type=sa.Text(), nullable=False)
@@ -0,0 +1,35 @@
+"""Add user.auth_version
+
+Revision ID: 0004_user_auth_version
+Revises: 0003_chinese_zodiac_fortune
+Create Date: 2026-10-19 09:07:00.000000
+
+NOT NULL with server default 1, so existing rows and the sessions that
+carry no version yet upgrade in place.
+
+Skipped when the objects already exist, because SQLite and debug
+deployments may have created them with db.create_all().
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_user_auth_version'
+down_revision = '0003_chinese_zodiac_fortune'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, column):
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    if not _has_column('user', 'auth_version'):
+        op.add_column('user', sa.Column('auth_version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('auth_version')
@@ -0,0 +1,40 @@
+"""Add cohort_stat for the materialized cohort statistics
+
+Revision ID: 0005_cohort_stat
+Revises: 0004_user_auth_version
+Create Date: 2026-10-19 09:08:00.000000
+
+Filled from the existing users by `flask rebuild-cohorts --if-empty`
+in the release step.
+
+Skipped when the objects already exist, because SQLite and debug
+deployments may have created them with db.create_all().
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_cohort_stat'
+down_revision = '0004_user_auth_version'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not _has_table('cohort_stat'):
+        op.create_table(
+            'cohort_stat',
+            sa.Column('dimension', sa.String(length=20), nullable=False),
+            sa.Column('value', sa.String(length=20), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('dimension', 'value'),
+        )
+
+
+def downgrade():
+    op.drop_table('cohort_stat')
@@ -0,0 +1,52 @@
+"""Add user_fortune history and the keyset pagination indexes
+
+Revision ID: 0006_user_fortune
+Revises: 0005_cohort_stat
+Create Date: 2026-10-19 09:09:00.000000
+
+- new table: user_fortune, indexed on (user_id, date, id)
+- new index: ix_daily_fortune_date_id on daily_fortune (date, id)
+
+Skipped when the objects already exist, because SQLite and debug
+deployments may have created them with db.create_all().
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_user_fortune'
+down_revision = '0005_cohort_stat'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def _has_index(table, index):
+    return index in {i['name'] for i in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    if not _has_index('daily_fortune', 'ix_daily_fortune_date_id'):
+        op.create_index('ix_daily_fortune_date_id', 'daily_fortune', ['date', 'id'])
+
+    if not _has_table('user_fortune'):
+        op.create_table(
+            'user_fortune',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('date', sa.Date(), nullable=False),
+            sa.Column('fortune', sa.Text(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_user_fortune_user_date_id', 'user_fortune', ['user_id', 'date', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_user_fortune_user_date_id', table_name='user_fortune')
+    op.drop_table('user_fortune')
+    op.drop_index('ix_daily_fortune_date_id', table_name='daily_fortune')
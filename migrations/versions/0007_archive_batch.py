@@ -0,0 +1,45 @@
+"""Add archive_batch for archived fortune rows
+
+Revision ID: 0007_archive_batch
+Revises: 0006_user_fortune
+Create Date: 2026-10-19 09:10:00.000000
+
+Gzip-compressed JSONL batches of rows moved out of the fortune tables.
+
+Skipped when the objects already exist, because SQLite and debug
+deployments may have created them with db.create_all().
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_archive_batch'
+down_revision = '0006_user_fortune'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not _has_table('archive_batch'):
+        op.create_table(
+            'archive_batch',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('table_name', sa.String(length=50), nullable=False),
+            sa.Column('first_date', sa.Date(), nullable=False),
+            sa.Column('last_date', sa.Date(), nullable=False),
+            sa.Column('row_count', sa.Integer(), nullable=False),
+            sa.Column('payload', sa.LargeBinary(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_archive_batch_table_dates', 'archive_batch', ['table_name', 'first_date', 'last_date'])
+
+
+def downgrade():
+    op.drop_index('ix_archive_batch_table_dates', table_name='archive_batch')
+    op.drop_table('archive_batch')
@@ -0,0 +1,38 @@
+"""Add app_flag for one-time application events
+
+Revision ID: 0008_app_flag
+Revises: 0007_archive_batch
+Create Date: 2026-10-19 09:11:00.000000
+
+Holds 'admin_bootstrapped', which makes only the first signup an admin.
+
+Skipped when the objects already exist, because SQLite and debug
+deployments may have created them with db.create_all().
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_app_flag'
+down_revision = '0007_archive_batch'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not _has_table('app_flag'):
+        op.create_table(
+            'app_flag',
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('name'),
+        )
+
+
+def downgrade():
+    op.drop_table('app_flag')
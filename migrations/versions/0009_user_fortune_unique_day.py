@@ -0,0 +1,42 @@
+"""Allow one user_fortune row per user and day
+
+Revision ID: 0009_user_fortune_unique_day
+Revises: 0008_app_flag
+Create Date: 2026-10-19 09:12:00.000000
+
+Concurrent first loads of a user's fortune could both insert a history row.
+Duplicates are deleted (the earliest row of each day is kept) before the
+unique constraint uq_user_fortune_user_date is added.
+
+Skipped when the constraint already exists, because SQLite and debug
+deployments may have created it with db.create_all().
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_user_fortune_unique_day'
+down_revision = '0008_app_flag'
+branch_labels = None
+depends_on = None
+
+
+def _has_unique_constraint(table, name):
+    return name in {c['name'] for c in sa.inspect(op.get_bind()).get_unique_constraints(table)}
+
+
+def upgrade():
+    if _has_unique_constraint('user_fortune', 'uq_user_fortune_user_date'):
+        return
+    op.execute(
+        'DELETE FROM user_fortune WHERE id NOT IN '
+        '(SELECT keep.id FROM (SELECT MIN(id) AS id FROM user_fortune GROUP BY user_id, date) AS keep)'
+    )
+    with op.batch_alter_table('user_fortune') as batch_op:
+        batch_op.create_unique_constraint('uq_user_fortune_user_date', ['user_id', 'date'])
+
+
+def downgrade():
+    with op.batch_alter_table('user_fortune') as batch_op:
+        batch_op.drop_constraint('uq_user_fortune_user_date', type_='unique')
@@ -1,8 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import NO_VALUE, NEVER_SET
 from flask_login import UserMixin
 from datetime import datetime
+from db_routing import RoutingSession
 
-db = SQLAlchemy()
+# RoutingSession sends read-only queries to the read replica when one is configured
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,13 +20,39 @@ class User(db.Model, UserMixin):
     last_fortune = db.Column(db.Text)
     last_fortune_date = db.Column(db.Date)
     role = db.Column(db.String(20), default='user')
+    # Bumped whenever role or password changes; sessions carrying an older
+    # version must log in again
+    auth_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+def _bump_auth_version(target, value, oldvalue, initiator):
+    if oldvalue not in (NO_VALUE, NEVER_SET) and value != oldvalue:
+        target.auth_version = (target.auth_version or 1) + 1
+    return value
+
+event.listen(User.password, 'set', _bump_auth_version, active_history=True)
+event.listen(User.role, 'set', _bump_auth_version, active_history=True)
 
 class DailyFortune(db.Model):
+    # Keyset pagination walks (date, id)
+    __table_args__ = (db.Index('ix_daily_fortune_date_id', 'date', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     zodiac_sign = db.Column(db.String(50), nullable=False)
     date = db.Column(db.Date, default=datetime.utcnow, nullable=False)
     fortune = db.Column(db.Text, nullable=False)
 
+class UserFortune(db.Model):
+    """A fortune generated for a user, one per user per day"""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'date', name='uq_user_fortune_user_date'),
+        db.Index('ix_user_fortune_user_date_id', 'user_id', 'date', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    fortune = db.Column(db.Text, nullable=False)
+
 class MBTITrait(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(4), unique=True, nullable=False)
@@ -32,4 +62,43 @@ class MBTITrait(db.Model):
 class ChineseZodiac(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sign = db.Column(db.String(20), unique=True, nullable=False)
-    yearly_fortune_2024 = db.Column(db.Text, nullable=False)
+    # Deprecated: yearly fortunes now live in ChineseZodiacFortune, keyed by year
+    yearly_fortune_2024 = db.Column(db.Text)
+
+class ChineseZodiacFortune(db.Model):
+    """Yearly fortune for a Chinese zodiac sign"""
+    __table_args__ = (db.UniqueConstraint('sign', 'year', name='uq_chinese_zodiac_fortune_sign_year'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    sign = db.Column(db.String(20), nullable=False)
+    year = db.Column(db.Integer, nullable=False, index=True)
+    fortune = db.Column(db.Text, nullable=False)
+
+class SeedState(db.Model):
+    """Content hash of the reference data last written by each seeder"""
+    name = db.Column(db.String(50), primary_key=True)
+    digest = db.Column(db.String(64), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+class AppFlag(db.Model):
+    """One-time application events, e.g. 'admin_bootstrapped' (see app_flags.py)"""
+    name = db.Column(db.String(50), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class CohortStat(db.Model):
+    """Materialized user counts per cohort, e.g. ('mbti', 'INTJ') or ('active_date', '2024-05-01')"""
+    dimension = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class ArchiveBatch(db.Model):
+    """A gzip-compressed JSONL batch of rows moved out of a hot table"""
+    __table_args__ = (db.Index('ix_archive_batch_table_dates', 'table_name', 'first_date', 'last_date'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    first_date = db.Column(db.Date, nullable=False)
+    last_date = db.Column(db.Date, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
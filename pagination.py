@@ -0,0 +1,72 @@
+"""
+Keyset (cursor) pagination over (date, id), newest first.
+
+A cursor is an opaque, URL-safe token holding the (date, id) of the last row
+on the previous page. Each page is fetched with an index range scan starting
+just after that key, so page N costs the same as page 1, unlike OFFSET. List
+endpoints select plain columns and serialize the rows directly, without
+building ORM objects.
+"""
+import base64
+from datetime import date
+
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class InvalidCursor(ValueError):
+    """A cursor that could not be decoded"""
+
+
+def encode_cursor(row_date, row_id):
+    raw = f"{row_date.isoformat()}:{row_id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        row_date, row_id = base64.urlsafe_b64decode(padded).decode('ascii').split(':')
+        return date.fromisoformat(row_date), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(str(e))
+
+
+def parse_limit(value):
+    """Clamp a ?limit= value to 1..MAX_LIMIT"""
+    try:
+        limit = int(value) if value is not None else DEFAULT_LIMIT
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def keyset_page(session, stmt, date_column, id_column, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    Fetch one page of `stmt` ordered by (date, id) descending
+
+    Args:
+        session: SQLAlchemy session
+        stmt: A select() of plain columns, including date_column and id_column
+        date_column: The date column to order by
+        id_column: The id column used as a tie breaker
+        cursor (str): Cursor from the previous page, or None for the first page
+        limit (int): Page size
+
+    Returns:
+        tuple: (list of row mappings, next cursor or None)
+    """
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(date_column, id_column) < tuple_(after_date, after_id))
+    stmt = stmt.order_by(date_column.desc(), id_column.desc()).limit(limit + 1)
+    rows = session.execute(stmt).mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[date_column.key], last[id_column.key])
+    return rows, next_cursor
@@ -0,0 +1,291 @@
+"""
+Outbound rate limiting for OpenAI calls.
+
+All call sites of generate_unique_fortune() share one OpenAIRateLimiter per
+process. It tracks requests per minute and tokens per minute with two token
+buckets, serves waiting callers in priority order (interactive requests
+before background pre-generation), resynchronises itself from the
+x-ratelimit-* headers OpenAI returns, and backs off as a whole when a 429
+comes back instead of letting every caller retry on its own. Transient
+failures (connection errors, 5xx) are retried a bounded number of times with
+jittered exponential backoff before they count towards the circuit breaker.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+
+def parse_reset_duration(value):
+    """
+    Parse an OpenAI reset header such as "1s", "6m0s" or "20ms"
+
+    Args:
+        value (str): Header value
+
+    Returns:
+        float: Seconds until the limit resets, or None if unparseable
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """A token bucket that refills continuously up to its capacity"""
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` tokens are available (0 if they already are)"""
+        self._refill(now)
+        # A single request larger than the bucket can never fit; let it through
+        # once the bucket is full rather than blocking forever.
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount):
+        self.tokens -= amount
+
+    def refund(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def sync(self, remaining):
+        """Never believe we have more capacity than the server says is left"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = min(self.tokens, float(remaining))
+
+
+class OpenAIRateLimiter:
+    """
+    Request/token rate limiter with priority admission and a circuit breaker
+
+    Callers reserve capacity with acquire(), make the request, then report the
+    outcome with complete(), rate_limited() or failed(). A transient failure is
+    first offered to retry_delay(); while it returns a delay the caller sleeps
+    and acquires again.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, failure_threshold=5, cooldown_seconds=30.0,
+                 max_retries=2, retry_base_delay=0.5):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._half_open_probe = False
+
+    @classmethod
+    def from_env(cls):
+        """Build a limiter from OPENAI_RPM / OPENAI_TPM, split across gunicorn workers, and OPENAI_MAX_RETRIES"""
+        workers = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+        rpm = float(os.getenv('OPENAI_RPM', '500')) / workers
+        tpm = float(os.getenv('OPENAI_TPM', '60000')) / workers
+        return cls(rpm, tpm, max_retries=int(os.getenv('OPENAI_MAX_RETRIES', '2')))
+
+    @property
+    def breaker_state(self):
+        with self._condition:
+            return self._breaker_state(time.monotonic())
+
+    def _breaker_state(self, now):
+        if self._opened_at is None:
+            return BREAKER_CLOSED
+        if now - self._opened_at >= self.cooldown_seconds:
+            return BREAKER_HALF_OPEN
+        return BREAKER_OPEN
+
+    def acquire(self, estimated_tokens, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """
+        Wait for capacity for one request of roughly `estimated_tokens`
+
+        Args:
+            estimated_tokens (int): Prompt plus expected completion tokens
+            priority (int): Lower values are admitted first
+            timeout (float): Maximum seconds to wait, None to wait indefinitely
+
+        Returns:
+            bool: True if the caller may send the request now
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            state = self._breaker_state(time.monotonic())
+            if state == BREAKER_OPEN or (state == BREAKER_HALF_OPEN and self._half_open_probe):
+                return False
+
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._waiters[0] == entry:
+                        wait = max(
+                            self._paused_until - now,
+                            self.requests.wait_time(1, now),
+                            self.tokens.wait_time(estimated_tokens, now),
+                        )
+                        if wait <= 0:
+                            self.requests.consume(1)
+                            self.tokens.consume(min(estimated_tokens, self.tokens.capacity))
+                            if self._breaker_state(now) == BREAKER_HALF_OPEN:
+                                self._half_open_probe = True
+                            return True
+                    else:
+                        wait = None
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._condition.wait(wait)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    async def acquire_async(self, estimated_tokens, priority=PRIORITY_INTERACTIVE, timeout=None,
+                            poll_interval=0.05):
+        """
+        acquire() for coroutines: polls without blocking the event loop
+
+        Waiting coroutines do not hold a place in the priority queue, so they
+        compete with threaded callers on each poll.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.acquire(estimated_tokens, priority=priority, timeout=0):
+                return True
+            if self.breaker_state == BREAKER_OPEN:
+                return False
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                await asyncio.sleep(min(poll_interval, remaining))
+            else:
+                await asyncio.sleep(poll_interval)
+
+    def complete(self, estimated_tokens, used_tokens=None, headers=None):
+        """Record a successful call and reconcile the token estimate"""
+        with self._condition:
+            if used_tokens is not None and used_tokens < estimated_tokens:
+                self.tokens.refund(estimated_tokens - used_tokens)
+            elif used_tokens is not None:
+                self.tokens.consume(used_tokens - estimated_tokens)
+            if headers is not None:
+                self._sync_headers(headers)
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._half_open_probe = False
+            self._condition.notify_all()
+
+    def rate_limited(self, headers=None):
+        """Record a 429: pause every caller until the server's reset time"""
+        with self._condition:
+            retry_after = None
+            if headers is not None:
+                self._sync_headers(headers)
+                retry_after = parse_reset_duration(headers.get('retry-after'))
+            retry_after = retry_after or 1.0
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            logger.warning(f"OpenAI rate limit hit, pausing outbound calls for {retry_after:.1f}s")
+            self._record_failure()
+
+    def retry_delay(self, estimated_tokens, attempt):
+        """
+        Decide whether a transient failure (connection error, 5xx) is retried
+
+        Args:
+            estimated_tokens (int): The estimate the failed attempt reserved;
+                it is refunded when a retry is allowed
+            attempt (int): Failed attempts so far for this call, starting at 1
+
+        Returns:
+            float: Seconds to sleep before acquiring again, or None when the
+                retries are used up and the caller should report failed()
+        """
+        with self._condition:
+            if attempt > self.max_retries or self._opened_at is not None:
+                return None
+            # The upstream did not process the request, so its tokens were not spent
+            self.tokens.refund(estimated_tokens)
+            self._condition.notify_all()
+        # Full jitter keeps callers that failed together from retrying together
+        return random.uniform(0, self.retry_base_delay * 2 ** (attempt - 1))
+
+    def failed(self):
+        """Record a non rate-limit failure"""
+        with self._condition:
+            self._record_failure()
+
+    def _record_failure(self):
+        self._half_open_probe = False
+        self._consecutive_failures += 1
+        if self._consecutive_failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning("OpenAI circuit breaker opened")
+            self._opened_at = time.monotonic()
+        self._condition.notify_all()
+
+    def _sync_headers(self, headers):
+        now = time.monotonic()
+        for bucket, kind in ((self.requests, 'requests'), (self.tokens, 'tokens')):
+            try:
+                remaining = float(headers.get(f'x-ratelimit-remaining-{kind}'))
+            except (TypeError, ValueError):
+                continue
+            bucket.sync(remaining)
+            if remaining <= 0:
+                reset = parse_reset_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                if reset:
+                    self._paused_until = max(self._paused_until, now + reset)
+
+
+def estimate_tokens(*texts, completion_tokens=150):
+    """Rough token estimate (about four characters per token) for a prompt and its reply"""
+    return sum(len(text) for text in texts) // 4 + completion_tokens
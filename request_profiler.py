@@ -0,0 +1,172 @@
+"""
+Slow-request log.
+
+Every request collects cheap timing records while it runs: each SQL statement
+(via SQLAlchemy cursor events on all engines), each upstream call wrapped in
+upstream_call() (OpenAI, RapidAPI) and each render_template() call. When the
+request takes longer than SLOW_REQUEST_THRESHOLD_MS, one JSON line with the
+whole breakdown is logged; otherwise the records are dropped, so fast
+requests only pay for a few perf_counter() calls and list appends.
+
+Statements are logged as SQLAlchemy sends them, with bound parameters left
+out and any inline literals replaced by '?'.
+"""
+import json
+import logging
+import re
+import time
+from contextlib import contextmanager
+
+from flask import before_render_template, g, has_app_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Per request; beyond this only the count and total time keep growing
+MAX_STATEMENTS = 100
+MAX_STATEMENT_LENGTH = 500
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+def redact_statement(statement):
+    """Collapse whitespace and replace inline literals with '?'"""
+    statement = _STRING_LITERAL.sub('?', ' '.join(statement.split()))
+    return _NUMBER_LITERAL.sub('?', statement)[:MAX_STATEMENT_LENGTH]
+
+
+class RequestProfile:
+    """Timings collected for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = []
+        self.statement_count = 0
+        self.sql_seconds = 0.0
+        self.upstream = []
+        self.templates = []
+        self.status = None
+
+    def add_statement(self, statement, seconds):
+        self.statement_count += 1
+        self.sql_seconds += seconds
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append((statement, seconds))
+
+    def to_record(self, duration):
+        return {
+            'event': 'slow_request',
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'endpoint': request.endpoint,
+            'path': request.path,
+            'status': self.status,
+            'duration_ms': _ms(duration),
+            'sql': {
+                'count': self.statement_count,
+                'total_ms': _ms(self.sql_seconds),
+                'statements': [
+                    {'statement': redact_statement(statement), 'duration_ms': _ms(seconds)}
+                    for statement, seconds in self.statements
+                ],
+            },
+            'upstream': [
+                {'service': service, 'duration_ms': _ms(seconds), 'ok': ok}
+                for service, seconds, ok in self.upstream
+            ],
+            'templates': [
+                {'name': name, 'duration_ms': _ms(seconds)} for name, seconds in self.templates
+            ],
+        }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def current_profile():
+    """The profile of the request being handled, or None (CLI, background work)"""
+    if not has_app_context():
+        return None
+    return g.get('_request_profile')
+
+
+@contextmanager
+def upstream_call(service):
+    """Time an outgoing call, e.g. `with upstream_call('openai'): ...`"""
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        profile.upstream.append((service, time.perf_counter() - started, ok))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the per-statement context, not the pooled connection, so a
+    # statement that raises (and never reaches after_cursor_execute) leaves nothing behind
+    if context is not None and current_profile() is not None:
+        context._profiler_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    started = getattr(context, '_profiler_started', None)
+    if profile is not None and started is not None:
+        profile.add_statement(statement, time.perf_counter() - started)
+
+
+def _before_render(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None:
+        g._template_started = time.perf_counter()
+
+
+def _rendered(sender, template, context, **extra):
+    profile = current_profile()
+    started = g.pop('_template_started', None)
+    if profile is not None and started is not None:
+        profile.templates.append((template.name, time.perf_counter() - started))
+
+
+def init_app(app):
+    app.config.setdefault('SLOW_REQUEST_THRESHOLD_MS', 1000)
+
+    # Listening on the Engine class covers the primary and the read replica
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    @app.before_request
+    def start_profile():
+        g._request_profile = RequestProfile()
+
+    @app.after_request
+    def record_status(response):
+        profile = current_profile()
+        if profile is not None:
+            profile.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def log_slow_request(exc):
+        profile = g.pop('_request_profile', None)
+        if profile is None:
+            return
+        duration = time.perf_counter() - profile.started
+        if duration * 1000 < app.config['SLOW_REQUEST_THRESHOLD_MS']:
+            return
+        record = profile.to_record(duration)
+        if exc is not None:
+            record['status'] = 500
+            record['error'] = type(exc).__name__
+        logger.warning(json.dumps(record))
@@ -0,0 +1,158 @@
+"""
+Retention, archival and compaction for DailyFortune and UserFortune.
+
+`flask prune` removes duplicate DailyFortune rows (keeping the newest per
+sign and day), then moves rows older than the retention window into
+ArchiveBatch: each batch of up to `batch_size` rows is gzip-compressed JSONL
+stored in one row, written in the same transaction that deletes the
+originals, so a run can be interrupted at any point without losing or
+duplicating data. Finally the hot tables are vacuumed/analyzed so they stay
+small. Archived rows remain queryable through iter_archive().
+"""
+import gzip
+import json
+import logging
+from datetime import timedelta
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import aliased
+
+from models import ArchiveBatch, DailyFortune, UserFortune
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_TABLES = {
+    DailyFortune.__tablename__: (DailyFortune, ['id', 'zodiac_sign', 'date', 'fortune']),
+    UserFortune.__tablename__: (UserFortune, ['id', 'user_id', 'date', 'fortune']),
+}
+
+
+def deduplicate_daily_fortunes(session, batch_size=1000):
+    """
+    Delete all but the newest DailyFortune per (zodiac_sign, date)
+
+    Returns:
+        int: Rows deleted
+    """
+    # A row is a duplicate if a newer one exists for its sign and day (an index
+    # lookup on (date, id)). Batches walk the table by id, so the whole run is
+    # one pass instead of a full GROUP BY per batch.
+    newer = aliased(DailyFortune)
+    has_newer = select(newer.id).where(
+        newer.zodiac_sign == DailyFortune.zodiac_sign, newer.date == DailyFortune.date, newer.id > DailyFortune.id
+    ).exists()
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = session.scalars(
+            select(DailyFortune.id).where(DailyFortune.id > last_id, has_newer)
+            .order_by(DailyFortune.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        session.execute(delete(DailyFortune).where(DailyFortune.id.in_(ids)))
+        session.commit()
+        deleted += len(ids)
+        last_id = ids[-1]
+    return deleted
+
+
+def _encode(rows):
+    lines = ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows)
+    return gzip.compress(lines.encode('utf-8'))
+
+
+def archive_older_than(session, table_name, cutoff, batch_size=1000):
+    """
+    Move rows dated before `cutoff` into ArchiveBatch, one batch per transaction
+
+    Returns:
+        int: Rows archived
+    """
+    model, columns = ARCHIVED_TABLES[table_name]
+    selected = [getattr(model, column) for column in columns]
+    archived = 0
+    while True:
+        rows = session.execute(
+            select(*selected).where(model.date < cutoff).order_by(model.date, model.id).limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            break
+        records = [{**row, 'date': row['date'].isoformat()} for row in rows]
+        try:
+            session.add(ArchiveBatch(
+                table_name=table_name,
+                first_date=rows[0]['date'],
+                last_date=rows[-1]['date'],
+                row_count=len(rows),
+                payload=_encode(records),
+            ))
+            session.execute(delete(model).where(model.id.in_([row['id'] for row in rows])))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        archived += len(rows)
+    return archived
+
+
+def iter_archive(session, table_name, start=None, end=None, **filters):
+    """
+    Yield archived rows of `table_name` dated within [start, end]
+
+    Args:
+        session: SQLAlchemy session
+        table_name (str): 'daily_fortune' or 'user_fortune'
+        start (date): Earliest date, inclusive
+        end (date): Latest date, inclusive
+        **filters: Exact-match filters on row fields, e.g. zodiac_sign='leo'
+
+    Yields:
+        dict: Archived row, with 'date' as an ISO string
+    """
+    stmt = select(ArchiveBatch.payload).where(ArchiveBatch.table_name == table_name)
+    if start is not None:
+        stmt = stmt.where(ArchiveBatch.last_date >= start)
+    if end is not None:
+        stmt = stmt.where(ArchiveBatch.first_date <= end)
+    start_iso = start.isoformat() if start else None
+    end_iso = end.isoformat() if end else None
+    for payload in session.scalars(stmt.order_by(ArchiveBatch.first_date, ArchiveBatch.id)):
+        for line in gzip.decompress(payload).decode('utf-8').splitlines():
+            row = json.loads(line)
+            if start_iso and row['date'] < start_iso or end_iso and row['date'] > end_iso:
+                continue
+            if all(row.get(key) == value for key, value in filters.items()):
+                yield row
+
+
+def compact(engine, table_names):
+    """VACUUM/ANALYZE the given tables outside a transaction (PostgreSQL and SQLite)"""
+    dialect = engine.dialect.name
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if dialect == 'postgresql':
+            for table_name in table_names:
+                connection.execute(text(f'VACUUM (ANALYZE) "{table_name}"'))
+        elif dialect == 'sqlite':
+            connection.execute(text('VACUUM'))
+            connection.execute(text('ANALYZE'))
+        else:
+            logger.info(f"Skipping compaction on unsupported dialect {dialect}")
+
+
+def prune(session, engine, today, daily_retention_days, user_retention_days, batch_size=1000, vacuum=True):
+    """
+    Run the whole maintenance pass
+
+    Returns:
+        dict: Row counts per step
+    """
+    report = {'duplicates_deleted': deduplicate_daily_fortunes(session, batch_size)}
+    report['daily_fortune_archived'] = archive_older_than(
+        session, DailyFortune.__tablename__, today - timedelta(days=daily_retention_days), batch_size)
+    report['user_fortune_archived'] = archive_older_than(
+        session, UserFortune.__tablename__, today - timedelta(days=user_retention_days), batch_size)
+    session.close()
+    if vacuum:
+        compact(engine, list(ARCHIVED_TABLES))
+    return report
@@ -1,82 +1,97 @@
-from models import db, ChineseZodiac
+from models import db, ChineseZodiac, ChineseZodiacFortune
+from seed_utils import sync_reference_data
+from zodiac_cache import zodiac_fortunes
 
-# Sample Chinese Zodiac data
-chinese_zodiac_data = [
+# Sample Chinese Zodiac fortunes, one row per (sign, year)
+chinese_zodiac_fortune_data = [
     {
         "sign": "Rat",
-        "yearly_fortune_2024": "The year 2024 will bring Rat natives opportunities for growth and success in their careers."
+        "year": 2024,
+        "fortune": "The year 2024 will bring Rat natives opportunities for growth and success in their careers."
     },
     {
         "sign": "Ox",
-        "yearly_fortune_2024": "Ox natives will find stability and steady progress in 2024, especially in personal relationships."
+        "year": 2024,
+        "fortune": "Ox natives will find stability and steady progress in 2024, especially in personal relationships."
     },
     {
         "sign": "Tiger",
-        "yearly_fortune_2024": "Tigers will experience dynamic changes and should embrace new adventures in 2024."
+        "year": 2024,
+        "fortune": "Tigers will experience dynamic changes and should embrace new adventures in 2024."
     },
     {
         "sign": "Rabbit",
-        "yearly_fortune_2024": "Rabbit natives will find peace and harmony in 2024, making it a great year for introspection."
+        "year": 2024,
+        "fortune": "Rabbit natives will find peace and harmony in 2024, making it a great year for introspection."
     },
     {
         "sign": "Dragon",
-        "yearly_fortune_2024": "2024 is a year of power and influence for Dragons, with significant achievements on the horizon."
+        "year": 2024,
+        "fortune": "2024 is a year of power and influence for Dragons, with significant achievements on the horizon."
     },
     {
         "sign": "Snake",
-        "yearly_fortune_2024": "Snakes will need to focus on personal development and healing in 2024 to achieve inner peace."
+        "year": 2024,
+        "fortune": "Snakes will need to focus on personal development and healing in 2024 to achieve inner peace."
     },
     {
         "sign": "Horse",
-        "yearly_fortune_2024": "Horses will find success in social and professional spheres, with plenty of opportunities for networking."
+        "year": 2024,
+        "fortune": "Horses will find success in social and professional spheres, with plenty of opportunities for networking."
     },
     {
         "sign": "Sheep",
-        "yearly_fortune_2024": "Sheep natives will experience emotional fulfillment and should focus on creative projects in 2024."
+        "year": 2024,
+        "fortune": "Sheep natives will experience emotional fulfillment and should focus on creative projects in 2024."
     },
     {
         "sign": "Monkey",
-        "yearly_fortune_2024": "Monkeys will find excitement and innovation in 2024, making it a great year for new ventures."
+        "year": 2024,
+        "fortune": "Monkeys will find excitement and innovation in 2024, making it a great year for new ventures."
     },
     {
         "sign": "Rooster",
-        "yearly_fortune_2024": "Roosters will see financial growth and should focus on long-term investments in 2024."
+        "year": 2024,
+        "fortune": "Roosters will see financial growth and should focus on long-term investments in 2024."
     },
     {
         "sign": "Dog",
-        "yearly_fortune_2024": "Dogs will experience loyalty and strong bonds in relationships, making 2024 a year of love and trust."
+        "year": 2024,
+        "fortune": "Dogs will experience loyalty and strong bonds in relationships, making 2024 a year of love and trust."
     },
     {
         "sign": "Pig",
-        "yearly_fortune_2024": "Pigs will find prosperity and joy in 2024, with opportunities for both personal and professional growth."
+        "year": 2024,
+        "fortune": "Pigs will find prosperity and joy in 2024, with opportunities for both personal and professional growth."
     }
 ]
 
-def seed_chinese_zodiac_data(db_instance=None):
+# The signs themselves; yearly fortunes are kept separately so a new year is just new rows
+chinese_zodiac_data = [{"sign": sign} for sign in dict.fromkeys(row["sign"] for row in chinese_zodiac_fortune_data)]
+
+def seed_chinese_zodiac_data(db_instance=None, force=False):
     """Seed the Chinese Zodiac table"""
     if db_instance is None:
         # This is for standalone execution
         from app import app, db
         with app.app_context():
-            _perform_seeding(db)
+            _perform_seeding(db, force)
     else:
         # This is when called from another module
-        _perform_seeding(db_instance)
+        _perform_seeding(db_instance, force)
         
-def _perform_seeding(db_instance):
-    # Clear existing data
-    db_instance.session.query(ChineseZodiac).delete()
-    
-    # Insert new data
-    for zodiac in chinese_zodiac_data:
-        new_zodiac = ChineseZodiac(
-            sign=zodiac['sign'],
-            yearly_fortune_2024=zodiac['yearly_fortune_2024']
-        )
-        db_instance.session.add(new_zodiac)
-    
-    db_instance.session.commit()
-    print("Chinese Zodiac data seeded successfully!")
+def _perform_seeding(db_instance, force=False):
+    # Skip the write entirely when the seed data has not changed
+    signs_changed = sync_reference_data(db_instance, 'chinese_zodiac', ChineseZodiac, chinese_zodiac_data,
+                                        key='sign', force=force)
+    fortunes_changed = sync_reference_data(db_instance, 'chinese_zodiac_fortune', ChineseZodiacFortune,
+                                           chinese_zodiac_fortune_data, key=('sign', 'year'), force=force)
+    if fortunes_changed:
+        zodiac_fortunes.invalidate()
+    if signs_changed or fortunes_changed:
+        print("Chinese Zodiac data seeded successfully!")
+    else:
+        print("Chinese Zodiac data unchanged, skipping.")
 
 # Allow running as a standalone script
 if __name__ == "__main__":
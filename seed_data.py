@@ -1,5 +1,5 @@
 from app import app, db, bcrypt
-from models import User, MBTITrait, ChineseZodiac
+from models import User, MBTITrait, ChineseZodiac, ChineseZodiacFortune
 from datetime import date
 
 def seed_database():
@@ -56,14 +56,19 @@ def seed_database():
         
         # Add Chinese Zodiac info if not already present
         if ChineseZodiac.query.count() == 0:
+            db.session.add_all([ChineseZodiac(sign='Horse'), ChineseZodiac(sign='Monkey')])
+
+        if ChineseZodiacFortune.query.count() == 0:
             zodiac_info = [
-                ChineseZodiac(
+                ChineseZodiacFortune(
                     sign='Horse',
-                    yearly_fortune_2024='A year of potential advancement and recognition in your career. Focus on building strong relationships and maintain a balanced approach to work and personal life.'
+                    year=2024,
+                    fortune='A year of potential advancement and recognition in your career. Focus on building strong relationships and maintain a balanced approach to work and personal life.'
                 ),
-                ChineseZodiac(
+                ChineseZodiacFortune(
                     sign='Monkey',
-                    yearly_fortune_2024='A year filled with creativity and unexpected opportunities. Your quick thinking will help you adapt to changing circumstances, but remember to follow through on your commitments.'
+                    year=2024,
+                    fortune='A year filled with creativity and unexpected opportunities. Your quick thinking will help you adapt to changing circumstances, but remember to follow through on your commitments.'
                 ),
                 # Add more as needed
             ]
@@ -1,4 +1,5 @@
 from models import db, MBTITrait
+from seed_utils import sync_reference_data
 
 # Complete MBTI data
 mbti_data = [
@@ -84,32 +85,23 @@ mbti_data = [
     }
 ]
 
-def seed_mbti_data(db_instance=None):
+def seed_mbti_data(db_instance=None, force=False):
     """Seed the MBTI traits table"""
     if db_instance is None:
         # This is for standalone execution
         from app import app, db
         with app.app_context():
-            _perform_seeding(db)
+            _perform_seeding(db, force)
     else:
         # This is when called from another module
-        _perform_seeding(db_instance)
+        _perform_seeding(db_instance, force)
         
-def _perform_seeding(db_instance):
-    # Clear existing data
-    db_instance.session.query(MBTITrait).delete()
-    
-    # Insert new data
-    for trait in mbti_data:
-        new_trait = MBTITrait(
-            type=trait['type'],
-            strengths=trait['strengths'],
-            weaknesses=trait['weaknesses']
-        )
-        db_instance.session.add(new_trait)
-    
-    db_instance.session.commit()
-    print("MBTI traits seeded successfully!")
+def _perform_seeding(db_instance, force=False):
+    # Skip the write entirely when the seed data has not changed
+    if sync_reference_data(db_instance, 'mbti', MBTITrait, mbti_data, key='type', force=force):
+        print("MBTI traits seeded successfully!")
+    else:
+        print("MBTI traits unchanged, skipping.")
 
 # Allow running as a standalone script
 if __name__ == "__main__":
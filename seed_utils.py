@@ -0,0 +1,116 @@
+"""
+Shared helpers for the reference data seeders.
+
+Each seeder hashes its seed data and compares it with the digest stored in
+SeedState. When nothing changed the run is a no-op; otherwise the rows are
+written with a single bulk upsert keyed on the natural key, rows no longer in
+the seed data are removed, and the new digest is recorded, all in one
+transaction. Existing IDs are preserved and the table is never empty.
+"""
+import hashlib
+import json
+from datetime import datetime
+
+from sqlalchemy import delete, func, select, tuple_
+
+from models import SeedState
+
+
+def content_hash(rows):
+    """SHA-256 of the seed rows in a canonical JSON form"""
+    payload = json.dumps(rows, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def dialect_insert(dialect_name):
+    """The dialect's INSERT construct if it supports ON CONFLICT, otherwise None"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+def _key_columns(model, keys):
+    if len(keys) == 1:
+        return getattr(model, keys[0])
+    return tuple_(*(getattr(model, key) for key in keys))
+
+
+def _key_values(row, keys):
+    if len(keys) == 1:
+        return row[keys[0]]
+    return tuple(row[key] for key in keys)
+
+
+def _upsert(session, model, rows, keys):
+    table = model.__table__
+    insert = dialect_insert(session.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(table).values(rows)
+        updates = {column: stmt.excluded[column] for column in rows[0] if column not in keys}
+        if updates:
+            stmt = stmt.on_conflict_do_update(index_elements=list(keys), set_=updates)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(keys))
+        session.execute(stmt)
+        return
+
+    # Generic fallback for databases without ON CONFLICT support
+    wanted = [_key_values(row, keys) for row in rows]
+    existing = {
+        _key_values({key: getattr(obj, key) for key in keys}, keys): obj
+        for obj in session.scalars(select(model).where(_key_columns(model, keys).in_(wanted)))
+    }
+    for row in rows:
+        obj = existing.get(_key_values(row, keys))
+        if obj is None:
+            session.add(model(**row))
+        else:
+            for column, value in row.items():
+                setattr(obj, column, value)
+
+
+def sync_reference_data(db_instance, name, model, rows, key, force=False):
+    """
+    Bring a reference table in line with its seed data
+
+    Args:
+        db_instance: Flask-SQLAlchemy instance
+        name (str): Name the digest is stored under in SeedState
+        model: Model class of the reference table
+        rows (list): Seed rows as dicts of column values
+        key (str or tuple): Natural key column(s) used for the upsert
+        force (bool): Rewrite the table even if the digest is unchanged
+
+    Returns:
+        bool: True if the table was written, False if it was already current
+    """
+    keys = (key,) if isinstance(key, str) else tuple(key)
+    session = db_instance.session
+    digest = content_hash(rows)
+    state = session.get(SeedState, name)
+    row_count = session.scalar(select(func.count()).select_from(model))
+    if not force and state is not None and state.digest == digest and row_count == len(rows):
+        session.rollback()
+        return False
+
+    try:
+        _upsert(session, model, rows, keys)
+        session.execute(
+            delete(model)
+            .where(_key_columns(model, keys).notin_([_key_values(row, keys) for row in rows]))
+            .execution_options(synchronize_session=False)
+        )
+        if state is None:
+            session.add(SeedState(name=name, digest=digest))
+        else:
+            state.digest = digest
+            state.updated_at = datetime.utcnow()
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return True
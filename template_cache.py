@@ -0,0 +1,86 @@
+"""
+Jinja bytecode and fragment caching.
+
+Compiled templates are written to a directory on disk so every gunicorn
+worker, and every restart, reuses the same bytecode instead of recompiling
+each template on first use. The {% cache %} tag caches rendered fragments in
+memory, keyed by the template, the tag's position and any key values passed
+to it:
+
+    {% cache 'nav', session.get('user_id') is not none %} ... {% endcache %}
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+
+class FragmentCache:
+    """Small thread-safe LRU of rendered fragments"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FragmentCacheExtension(Extension):
+    """Adds {% cache key, ... %}...{% endcache %}"""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(f"{parser.name}:{lineno}")]
+        key_parts = []
+        while parser.stream.current.type != 'block_end':
+            if key_parts:
+                parser.stream.expect('comma')
+            key_parts.append(parser.parse_expression())
+        args.append(nodes.Tuple(key_parts, 'load'))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, location, key, caller):
+        cache_key = (location,) + tuple(key)
+        value = self.environment.fragment_cache.get(cache_key)
+        if value is None:
+            value = caller()
+            self.environment.fragment_cache.set(cache_key, value)
+        return value
+
+
+def init_app(app):
+    """Enable the on-disk bytecode cache and the {% cache %} tag (before the first render)"""
+    cache_dir = os.getenv('JINJA_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    extensions = list(app.jinja_options.get('extensions', [])) + [FragmentCacheExtension]
+    app.jinja_options = {
+        **app.jinja_options,
+        'bytecode_cache': FileSystemBytecodeCache(cache_dir),
+        'extensions': extensions,
+    }
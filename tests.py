@@ -1,10 +1,33 @@
 import unittest
-from app import app, db
-from models import User, DailyFortune, MBTITrait, ChineseZodiac
-from datetime import datetime, date, timedelta
+from flask import Flask, url_for
+from sqlalchemy import event, insert, select
+from app import app, db, get_chinese_zodiac, get_zodiac_sign
+import assets
+import cohorts
+import retention
+from models import User, DailyFortune, MBTITrait, ChineseZodiac, ChineseZodiacFortune, UserFortune
+from datetime import datetime, date, timedelta, timezone
 from flask_bcrypt import Bcrypt
+from db_routing import init_replica, replica_health
+from identity import AuthVersionCache, auth_versions
+from assets import build_assets, load_manifest
+from zodiac_cache import ZodiacFortuneCache, zodiac_fortunes
+from user_transfer import import_users, export_users
+from seed_mbti import mbti_data
+from seed_utils import sync_reference_data
+from local_fortune import generate_local_fortune
+from horoscope_provider import (CachingHoroscopeProvider, HoroscopeProvider, HoroscopeResponse,
+                                 RecordingHoroscopeProvider, build_provider, prune_cache)
+from rate_limiter import (OpenAIRateLimiter, BREAKER_OPEN, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE,
+                          parse_reset_duration)
+import asyncio
+import gzip
+import importlib.util
+import io
 import json
 import os
+import tempfile
+import threading
 
 class FortuneTellingAppTests(unittest.TestCase):
     """Test suite for the Fortune Telling Web Application"""
@@ -71,15 +94,19 @@ class FortuneTellingAppTests(unittest.TestCase):
             weaknesses='Disorganized, overly optimistic, trouble focusing'
         )
         
-        # Create test Chinese Zodiac
-        horse_zodiac = ChineseZodiac(
+        # Create test Chinese Zodiac signs and this year's fortunes
+        horse_zodiac = ChineseZodiac(sign='Horse')
+        monkey_zodiac = ChineseZodiac(sign='Monkey')
+        this_year = datetime.utcnow().year
+        horse_fortune = ChineseZodiacFortune(
             sign='Horse',
-            yearly_fortune_2024='A year of potential advancement and recognition.'
+            year=this_year,
+            fortune='A year of potential advancement and recognition.'
         )
-        
-        monkey_zodiac = ChineseZodiac(
+        monkey_fortune = ChineseZodiacFortune(
             sign='Monkey',
-            yearly_fortune_2024='A year of innovation and unexpected opportunities.'
+            year=this_year,
+            fortune='A year of innovation and unexpected opportunities.'
         )
         
         # Create test daily fortune
@@ -96,9 +123,12 @@ class FortuneTellingAppTests(unittest.TestCase):
             fortune='Communication is highlighted today. Express your ideas clearly.'
         )
         
-        db.session.add_all([admin_user, regular_user, intj_trait, enfp_trait, 
-                            horse_zodiac, monkey_zodiac, taurus_fortune, gemini_fortune])
+        db.session.add_all([admin_user, regular_user, intj_trait, enfp_trait,
+                            horse_zodiac, monkey_zodiac, horse_fortune, monkey_fortune,
+                            taurus_fortune, gemini_fortune])
         db.session.commit()
+        # Views read Chinese zodiac fortunes through the process-wide cache
+        zodiac_fortunes.invalidate()
     
     # Test User Authentication
     def test_login_success(self):
@@ -140,6 +170,248 @@ class FortuneTellingAppTests(unittest.TestCase):
             self.assertEqual(user.email, 'new@test.com')
             self.assertEqual(user.role, 'user')
     
+    def test_signup_rejects_taken_username(self):
+        """Test that a duplicate username is reported on the form instead of failing at commit"""
+        response = self.app.post('/signup', data={
+            'name': 'Another User',
+            'birthday': '1995-03-15',
+            'username': 'testuser',
+            'email': 'another@test.com',
+            'password': 'newpassword123',
+            'confirm_password': 'newpassword123',
+        }, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'That username is already taken', response.data)
+        with app.app_context():
+            self.assertIsNone(User.query.filter_by(email='another@test.com').first())
+
+    def test_first_signup_becomes_admin_once(self):
+        """Test that only the first account on an empty database is made admin"""
+        with app.app_context():
+            User.query.delete()
+            db.session.commit()
+        for index in range(2):
+            self.app.post('/signup', data={
+                'name': 'New User',
+                'birthday': '1995-03-15',
+                'username': f'newuser{index}',
+                'email': f'new{index}@test.com',
+                'password': 'newpassword123',
+                'confirm_password': 'newpassword123',
+            })
+        with app.app_context():
+            self.assertEqual(User.query.filter_by(username='newuser0').first().role, 'admin')
+            self.assertEqual(User.query.filter_by(username='newuser1').first().role, 'user')
+
+    # Test Cohort Statistics
+    def test_signup_updates_cohorts_and_rebuild_matches(self):
+        """Test incremental cohort counts against a full rebuild"""
+        with app.app_context():
+            # The fixture users predate the counters, as on a first deploy
+            self.assertTrue(cohorts.rebuild_if_empty(db.session))
+            self.assertFalse(cohorts.rebuild_if_empty(db.session))
+        self.app.post('/signup', data={
+            'name': 'New User',
+            'birthday': '1995-03-15',
+            'username': 'newuser',
+            'email': 'new@test.com',
+            'password': 'newpassword123',
+            'confirm_password': 'newpassword123',
+            'mbti': 'ISFJ'
+        })
+        source = io.StringIO(
+            'name,birthday,username,email,password,mbti\n'
+            'Bulk User,1988-07-04,bulkuser,bulk@test.com,bulkpassword1,INTP\n'
+        )
+        with app.app_context():
+            import_users(db.session, source, 'csv', get_chinese_zodiac, rounds=4, workers=1)
+            incremental = cohorts.summary(db.session, date.today())
+            self.assertEqual(incremental['total'], 4)
+            self.assertIn(('pisces', 1), incremental['sun_sign'])
+            self.assertIn(('cancer', 1), incremental['sun_sign'])
+            self.assertIn(('ISFJ', 1), incremental['mbti'])
+
+            cohorts.rebuild(db.session)
+            self.assertEqual(cohorts.summary(db.session, date.today()), incremental)
+
+    def test_sun_sign_cusps(self):
+        """Test get_zodiac_sign on both sides of every cusp of the original sign table"""
+        cusps = [
+            ((1, 19), 'capricorn'), ((1, 20), 'aquarius'), ((2, 18), 'aquarius'), ((2, 19), 'pisces'),
+            ((3, 20), 'pisces'), ((3, 21), 'aries'), ((4, 19), 'aries'), ((4, 20), 'taurus'),
+            ((5, 20), 'taurus'), ((5, 21), 'gemini'), ((6, 20), 'gemini'), ((6, 21), 'cancer'),
+            ((7, 22), 'cancer'), ((7, 23), 'leo'), ((8, 22), 'leo'), ((8, 23), 'virgo'),
+            ((9, 22), 'virgo'), ((9, 23), 'libra'), ((10, 22), 'libra'), ((10, 23), 'scorpio'),
+            ((11, 21), 'scorpio'), ((11, 22), 'sagittarius'), ((12, 21), 'sagittarius'), ((12, 22), 'capricorn'),
+        ]
+        for (month, day), sign in cusps:
+            self.assertEqual(get_zodiac_sign(day, month), sign, (month, day))
+        self.assertEqual(get_zodiac_sign(29, 2), 'pisces')
+
+    def test_rebuild_sun_signs_match_python(self):
+        """Test that the SQL sun sign expression agrees with get_zodiac_sign"""
+        with app.app_context():
+            expression = cohorts._sun_sign_expression()
+            day = date(2024, 1, 1)
+            while day.year == 2024:
+                user = User.query.filter_by(username='testuser').first()
+                user.birthday = day
+                db.session.flush()
+                sql_sign = db.session.scalar(select(expression).where(User.id == user.id))
+                self.assertEqual(sql_sign, get_zodiac_sign(day.day, day.month), day)
+                day += timedelta(days=1)
+            db.session.rollback()
+
+    def test_analytics_page(self):
+        """Test the admin analytics page"""
+        self.app.post('/login', data={
+            'username': 'admin',
+            'password': 'testadmin123'
+        })
+        response = self.app.get('/analytics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'User Analytics', response.data)
+
+    # Test JSON API
+    def test_api_requires_login(self):
+        """Test that API endpoints return 401 without a session"""
+        response = self.app.get('/api/v1/fortune/today')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.get_json()['error'], 'authentication required')
+
+    def test_api_today_and_history_with_etag(self):
+        """Test today's fortune, history and conditional responses"""
+        self.app.post('/login', data={
+            'username': 'testuser',
+            'password': 'testuser123'
+        })
+        response = self.app.get('/api/v1/fortune/today')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['zodiac_sign'], 'taurus')
+
+        response = self.app.get('/api/v1/fortunes/history')
+        history = response.get_json()
+        self.assertEqual(len(history['items']), 1)
+        self.assertIsNone(history['next_cursor'])
+
+        etag = response.headers['ETag']
+        response = self.app.get('/api/v1/fortunes/history', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_api_json_login(self):
+        """Test that API clients can log in and out with JSON, without the HTML form"""
+        response = self.app.post('/api/v1/login', json={'username': 'testuser', 'password': 'wrongpassword'})
+        self.assertEqual(response.status_code, 401)
+        response = self.app.post('/api/v1/login', data={'username': 'testuser', 'password': 'testuser123'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.app.post('/api/v1/login', json={'username': 'testuser', 'password': 'testuser123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['role'], 'user')
+        self.assertEqual(self.app.get('/api/v1/fortune/today').status_code, 200)
+
+        self.assertEqual(self.app.post('/api/v1/logout').status_code, 204)
+        self.assertEqual(self.app.get('/api/v1/fortune/today').status_code, 401)
+
+    def test_concurrent_first_load_keeps_one_history_row(self):
+        """Test that a request losing the race for today's history row shows the winner's fortune"""
+        today = datetime.now(timezone.utc).date()
+        with app.app_context():
+            user_id = User.query.filter_by(username='testuser').first().id
+            # A concurrent request already stored today's fortune; this process has not seen it yet
+            db.session.add(UserFortune(user_id=user_id, date=today, fortune='The winner of the race.'))
+            db.session.commit()
+        self.app.post('/api/v1/login', json={'username': 'testuser', 'password': 'testuser123'})
+
+        response = self.app.get('/api/v1/fortune/today')
+        self.assertEqual(response.get_json()['fortune'], 'The winner of the race.')
+        with app.app_context():
+            self.assertEqual(UserFortune.query.filter_by(user_id=user_id).count(), 1)
+            self.assertEqual(cohorts.summary(db.session, today)['active_today'], 0)
+
+    def test_api_admin_listing_keyset_pagination(self):
+        """Test cursor pagination over the DailyFortune listing"""
+        with app.app_context():
+            start = date(2024, 1, 1)
+            db.session.add_all([
+                DailyFortune(zodiac_sign='aries', date=start + timedelta(days=i), fortune=f'Fortune {i}')
+                for i in range(5)
+            ])
+            db.session.commit()
+        self.app.post('/login', data={
+            'username': 'admin',
+            'password': 'testadmin123'
+        })
+        seen = []
+        cursor = None
+        while True:
+            url = '/api/v1/admin/daily-fortunes?sign=aries&limit=2' + (f'&cursor={cursor}' if cursor else '')
+            page = self.app.get(url).get_json()
+            seen.extend(item['fortune'] for item in page['items'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, [f'Fortune {i}' for i in range(4, -1, -1)])
+
+        response = self.app.get('/api/v1/admin/daily-fortunes?cursor=bogus')
+        self.assertEqual(response.status_code, 400)
+
+    # Test Retention and Archival
+    def test_prune_deduplicates_and_archives(self):
+        """Test that prune removes duplicates and archives old rows"""
+        today = datetime.now().date()
+        old_day = today - timedelta(days=120)
+        with app.app_context():
+            db.session.add_all([
+                DailyFortune(zodiac_sign='taurus', date=today, fortune='Another fetch.'),
+                DailyFortune(zodiac_sign='taurus', date=today, fortune='Duplicate fetch.'),
+                DailyFortune(zodiac_sign='leo', date=old_day, fortune='Old leo fortune.'),
+            ])
+            db.session.commit()
+
+            report = retention.prune(db.session, db.engine, today, daily_retention_days=90,
+                                     user_retention_days=365, batch_size=1, vacuum=False)
+            self.assertEqual(report['duplicates_deleted'], 2)
+            self.assertEqual(report['daily_fortune_archived'], 1)
+            self.assertEqual(DailyFortune.query.filter_by(zodiac_sign='taurus').one().fortune, 'Duplicate fetch.')
+            self.assertEqual(DailyFortune.query.filter_by(zodiac_sign='gemini').count(), 1)
+            self.assertIsNone(DailyFortune.query.filter_by(zodiac_sign='leo').first())
+
+            archived = list(retention.iter_archive(db.session, 'daily_fortune', start=old_day, zodiac_sign='leo'))
+            self.assertEqual([row['fortune'] for row in archived], ['Old leo fortune.'])
+            self.assertEqual(list(retention.iter_archive(db.session, 'daily_fortune', end=old_day - timedelta(days=1))), [])
+
+    def test_prune_command_fails_with_exit_status(self):
+        """Test that a failed prune makes the CLI exit non-zero for the cron job"""
+        prune = retention.prune
+
+        def failing_prune(*args, **kwargs):
+            raise RuntimeError('database went away')
+
+        retention.prune = failing_prune
+        try:
+            # Keep every cached horoscope day
+            result = app.test_cli_runner().invoke(args=['prune', '--horoscope-cache-days', '100000'])
+        finally:
+            retention.prune = prune
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('database went away', result.output)
+
+    def test_rebuild_cohorts_command_fails_with_exit_status(self):
+        """Test that a failed cohort rebuild makes the release step exit non-zero"""
+        rebuild = cohorts.rebuild
+
+        def failing_rebuild(*args, **kwargs):
+            raise RuntimeError('database went away')
+
+        cohorts.rebuild = failing_rebuild
+        try:
+            result = app.test_cli_runner().invoke(args=['rebuild-cohorts'])
+        finally:
+            cohorts.rebuild = rebuild
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('database went away', result.output)
+
     # Test Role-Based Access Control
     def test_admin_access(self):
         """Test admin access to generate fortunes page"""
@@ -153,6 +425,24 @@ class FortuneTellingAppTests(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Generate Today\'s Fortune', response.data)
     
+    def test_generate_fortunes_replays_recorded_responses(self):
+        """Test that replay mode fills DailyFortune offline and re-runs add no duplicates"""
+        import app as app_module
+        with tempfile.TemporaryDirectory() as cassette_dir:
+            with open(os.path.join(cassette_dir, 'leo.json'), 'w') as f:
+                json.dump({'response': {'status_code': 200, 'body': {'horoscope': 'Roar today.'}}}, f)
+            mode, cassettes = app_module.HOROSCOPE_PROVIDER_MODE, app_module.HOROSCOPE_CASSETTE_DIR
+            app_module.HOROSCOPE_PROVIDER_MODE, app_module.HOROSCOPE_CASSETTE_DIR = 'replay', cassette_dir
+            try:
+                self.app.post('/login', data={'username': 'admin', 'password': 'testadmin123'})
+                self.app.post('/generate_fortunes')
+                response = self.app.post('/generate_fortunes', follow_redirects=True)
+            finally:
+                app_module.HOROSCOPE_PROVIDER_MODE, app_module.HOROSCOPE_CASSETTE_DIR = mode, cassettes
+        self.assertIn(b'generated successfully', response.data)
+        with app.app_context():
+            self.assertEqual(DailyFortune.query.filter_by(fortune='Roar today.').count(), 1)
+
     def test_regular_user_cannot_access_admin_page(self):
         """Test regular user cannot access admin-only pages"""
         # Login as regular user
@@ -165,6 +455,73 @@ class FortuneTellingAppTests(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'You do not have permission', response.data)
     
+    def _statements(self, path):
+        """SQL statements run while serving GET `path`"""
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            self.assertEqual(self.app.get(path).status_code, 200)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return statements
+
+    def test_logged_in_pages_do_not_load_user(self):
+        """Test that rendering pages for a logged-in admin never queries the user table"""
+        self.app.post('/login', data={'username': 'admin', 'password': 'testadmin123'})
+        self.assertEqual(self._statements('/'), [])
+        self.assertEqual(self._statements('/generate_fortunes'), [])
+        self.assertEqual([statement for statement in self._statements('/analytics') if 'FROM user' in statement], [])
+
+    def test_role_change_invalidates_session(self):
+        """Test that changing a user's role forces them to log in again"""
+        self.app.post('/login', data={
+            'username': 'admin',
+            'password': 'testadmin123'
+        })
+        with app.app_context():
+            admin = User.query.filter_by(username='admin').first()
+            admin.role = 'user'
+            db.session.commit()
+            self.assertEqual(admin.auth_version, 2)
+            # The commit updated this process's cache; no TTL wait or clear() needed
+            self.assertEqual(auth_versions.get(admin.id), (2, 'user'))
+
+        response = self.app.get('/generate_fortunes', follow_redirects=True)
+        self.assertIn(b'Your session has expired', response.data)
+
+    def test_auth_version_cache_is_bounded(self):
+        """Test that the auth_version cache evicts its least recently used users"""
+        cache = AuthVersionCache(ttl_seconds=30, max_entries=2)
+        cache.set(1, 1, 'user')
+        cache.set(2, 1, 'user')
+        self.assertEqual(cache.get(1), (1, 'user'))
+        cache.set(3, 1, 'user')
+        self.assertEqual(list(cache._entries), [1, 3])
+
+    # Test Health Endpoints
+    def test_healthz(self):
+        """Test the liveness endpoint"""
+        response = self.app.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'ok')
+        self.assertNotIn('Set-Cookie', response.headers)
+
+    def test_readyz_reports_database_and_fortunes(self):
+        """Test the readiness endpoint report"""
+        response = self.app.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        report = response.get_json()
+        self.assertTrue(report['database']['ok'])
+        self.assertIn('pool', report['database'])
+        self.assertIn(report['openai']['breaker'], ('closed', 'open', 'half_open'))
+        self.assertFalse(report['database']['fortunes']['fresh'])
+
     # Test User Profile Editing
     def test_edit_account(self):
         """Test editing user account details"""
@@ -207,6 +564,817 @@ class FortuneTellingAppTests(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         # The page should contain the user's zodiac sign (Taurus for May 15)
         self.assertIn(b'taurus', response.data.lower())
+        # and the Monkey's yearly fortune, served by the zodiac fortune cache
+        self.assertIn(b'A year of innovation and unexpected opportunities.', response.data)
+
+    def test_daily_fortune_without_inputs_has_no_placeholders(self):
+        """Test that a user with no MBTI type, horoscope or zodiac fortune gets a fortune without placeholder text"""
+        with app.app_context():
+            password = self.bcrypt.generate_password_hash('nomatch123').decode('utf-8')
+            # Aries and Dog have no DailyFortune or ChineseZodiacFortune rows
+            db.session.add(User(name='No Type', birthday=date(1994, 4, 1), username='notype',
+                                email='notype@test.com', password=password, mbti=None, chinese_zodiac='Dog'))
+            db.session.commit()
+        self.app.post('/login', data={'username': 'notype', 'password': 'nomatch123'})
+
+        response = self.app.get('/daily_fortune')
+        self.assertEqual(response.status_code, 200)
+        with app.app_context():
+            fortune = User.query.filter_by(username='notype').first().last_fortune
+        self.assertTrue(fortune)
+        for placeholder in ('available', 'Unable to fetch'):
+            self.assertNotIn(placeholder, fortune)
+
+    # Test Slow Request Log
+    def test_slow_request_logs_json_breakdown(self):
+        """Test that a request over the threshold logs its queries and templates as JSON"""
+        self.app.post('/login', data={'username': 'testuser', 'password': 'testuser123'})
+        threshold = app.config['SLOW_REQUEST_THRESHOLD_MS']
+        app.config['SLOW_REQUEST_THRESHOLD_MS'] = 0
+        try:
+            with self.assertLogs('request_profiler', 'WARNING') as logs:
+                self.app.get('/daily_fortune')
+        finally:
+            app.config['SLOW_REQUEST_THRESHOLD_MS'] = threshold
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['route'], '/daily_fortune')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['sql']['count'], 0)
+        self.assertIn('fortune.html', [template['name'] for template in record['templates']])
+        self.assertNotIn('testuser', json.dumps(record['sql']))
+
+    def test_failed_statement_does_not_skew_later_timings(self):
+        """Test that a statement that raises leaves no timing state behind on the pooled connection"""
+        import time
+        from sqlalchemy import text
+        from sqlalchemy.exc import OperationalError
+        from flask import g
+        from request_profiler import RequestProfile
+
+        with app.test_request_context('/'):
+            g._request_profile = profile = RequestProfile()
+            with db.engine.connect() as connection:
+                with self.assertRaises(OperationalError):
+                    connection.execute(text('SELECT * FROM no_such_table'))
+                connection.rollback()
+                time.sleep(0.2)
+                connection.execute(text('SELECT 1'))
+                self.assertNotIn('_profiler_started', connection.info)
+        self.assertEqual(profile.statement_count, 1)
+        statement, seconds = profile.statements[0]
+        self.assertEqual(statement, 'SELECT 1')
+        self.assertLess(seconds, 0.1)
+
+    def test_fast_request_not_logged(self):
+        """Test that requests under the threshold log nothing"""
+        threshold = app.config['SLOW_REQUEST_THRESHOLD_MS']
+        app.config['SLOW_REQUEST_THRESHOLD_MS'] = 60000
+        try:
+            with self.assertNoLogs('request_profiler', 'WARNING'):
+                self.app.get('/login')
+        finally:
+            app.config['SLOW_REQUEST_THRESHOLD_MS'] = threshold
+
+    # Test Response Compression and Fragment Caching
+    def test_html_compressed_when_accepted(self):
+        """Test that large HTML responses are gzip compressed on request"""
+        response = self.app.get('/signup', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+        self.assertIn(b'Sign Up', gzip.decompress(response.data))
+
+        response = self.app.get('/signup')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_compression_runs_after_other_handlers(self):
+        """Test that compression is registered first, since after_request handlers run in reverse"""
+        self.assertEqual(app.after_request_funcs[None][0].__name__, 'compress_response')
+
+    def test_cached_nav_follows_login_state(self):
+        """Test that the cached navigation fragment is keyed on login state"""
+        response = self.app.get('/')
+        self.assertIn(b'Sign Up', response.data)
+        self.app.post('/login', data={'username': 'testuser', 'password': 'testuser123'})
+        response = self.app.get('/')
+        self.assertIn(b'Logout', response.data)
+        self.assertNotIn(b"Generate Today's Fortune</a>", response.data)
+
+    # Test Bulk User Import/Export
+    def test_import_and_export_users(self):
+        """Test streaming user import followed by export"""
+        source = io.StringIO(
+            'name,birthday,username,email,password,mbti\n'
+            'Bulk User,1988-07-04,bulkuser,bulk@test.com,bulkpassword1,INTP\n'
+            'Bad Date,not-a-date,baddate,bad@test.com,bulkpassword1,\n'
+            'Duplicate,1990-01-01,admin,dupe@test.com,bulkpassword1,\n'
+        )
+        with app.app_context():
+            imported, skipped = import_users(db.session, source, 'csv', get_chinese_zodiac, rounds=4, workers=1)
+            self.assertEqual((imported, skipped), (1, 2))
+            user = User.query.filter_by(username='bulkuser').first()
+            self.assertEqual(user.chinese_zodiac, 'Dragon')
+            self.assertTrue(self.bcrypt.check_password_hash(user.password, 'bulkpassword1'))
+
+            exported = io.StringIO()
+            self.assertEqual(export_users(db.session, exported, 'jsonl'), 3)
+            rows = [json.loads(line) for line in exported.getvalue().splitlines()]
+            self.assertIn('bulkuser', [row['username'] for row in rows])
+
+    def test_import_and_export_users_commands(self):
+        """Test the CLI wrappers: '-' for stdout, the format from the extension, and a usage error for a missing file"""
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['export-users', '-'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertTrue(result.stdout.startswith('name,'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.jsonl')
+            result = runner.invoke(args=['export-users', path])
+            self.assertEqual(result.exit_code, 0, result.output)
+            with open(path, encoding='utf-8') as f:
+                self.assertEqual(len([json.loads(line) for line in f]), 2)
+
+            result = runner.invoke(args=['import-users', os.path.join(directory, 'missing.csv')])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('No such file or directory', result.output)
+
+    def test_import_skips_duplicates_within_and_across_batches(self):
+        """Test that repeated usernames and emails in the file are imported once"""
+        source = io.StringIO(
+            'name,birthday,username,email,password,mbti\n'
+            'First,1988-07-04,first,first@test.com,bulkpassword1,\n'
+            'Same Batch,1988-07-04,first,other@test.com,bulkpassword1,\n'
+            'Second,1988-07-04,second,second@test.com,bulkpassword1,\n'
+            'Later Batch,1988-07-04,third,first@test.com,bulkpassword1,\n'
+        )
+        with app.app_context():
+            imported, skipped = import_users(db.session, source, 'csv', get_chinese_zodiac, batch_size=2,
+                                             rounds=4, workers=1)
+            self.assertEqual((imported, skipped), (2, 2))
+            self.assertEqual(User.query.filter(User.username.in_(['first', 'second', 'third'])).count(), 2)
+
+    def test_import_skips_non_object_jsonl_rows(self):
+        """Test that JSONL lines that are not objects are reported and skipped"""
+        source = io.StringIO(
+            '[1, 2]\n'
+            '"x"\n'
+            '{"name": "Bulk User", "birthday": "1988-07-04", "username": "bulkuser", '
+            '"email": "bulk@test.com", "password": "bulkpassword1"}\n'
+        )
+        errors = []
+        with app.app_context():
+            imported, skipped = import_users(db.session, source, 'jsonl', get_chinese_zodiac, rounds=4, workers=1,
+                                             errors=lambda line, message: errors.append((line, message)))
+        self.assertEqual((imported, skipped), (1, 2))
+        self.assertEqual(errors, [(1, 'row must be a JSON object'), (2, 'row must be a JSON object')])
+
+    def test_import_skips_rows_with_mistyped_fields(self):
+        """Test that JSONL fields that are not strings are reported and skipped, not fatal"""
+        valid = {'name': 'Bulk User', 'birthday': '1988-07-04', 'username': 'bulkuser',
+                 'email': 'bulk@test.com', 'password': 'bulkpassword1'}
+        rows = [
+            dict(valid, name=12345),
+            dict(valid, birthday=19880704),
+            dict(valid, password=12345678),
+            dict(valid, password_hash=['$2b$']),
+            valid,
+        ]
+        source = io.StringIO(''.join(json.dumps(row) + '\n' for row in rows))
+        errors = []
+        with app.app_context():
+            imported, skipped = import_users(db.session, source, 'jsonl', get_chinese_zodiac, rounds=4, workers=1,
+                                             errors=lambda line, message: errors.append((line, message)))
+        self.assertEqual((imported, skipped), (1, 4))
+        self.assertEqual(errors, [(1, 'name must be a string'), (2, 'birthday must be a string'),
+                                  (3, 'password must be a string'), (4, 'password_hash must be a string')])
+
+    # Test Chinese Zodiac Fortune Cache
+    def test_zodiac_cache_uses_latest_seeded_year(self):
+        """Test that the cache serves the latest year that is not in the future"""
+        with app.app_context():
+            db.session.add_all([
+                ChineseZodiacFortune(sign='Rat', year=2024, fortune='Rat 2024 fortune.'),
+                ChineseZodiacFortune(sign='Rat', year=2025, fortune='Rat 2025 fortune.'),
+                ChineseZodiacFortune(sign='Rat', year=2099, fortune='Rat 2099 fortune.'),
+            ])
+            db.session.commit()
+            cache = ZodiacFortuneCache()
+            cache.load(calendar_year=2025)
+            self.assertEqual(cache.year, 2025)
+            self.assertEqual(cache._snapshot.fortunes.get('Rat'), 'Rat 2025 fortune.')
+            cache.load(calendar_year=2024)
+            self.assertEqual(cache._snapshot.fortunes.get('Rat'), 'Rat 2024 fortune.')
+
+class ReplicaRoutingTests(unittest.TestCase):
+    """Tests for read-replica routing of db.session"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.replica_app = Flask('replica_test')
+        self.replica_app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{self.tmp.name}/primary.db'
+        db.init_app(self.replica_app)
+        replica = init_replica(self.replica_app, f'sqlite:///{self.tmp.name}/replica.db')
+        with self.replica_app.app_context():
+            db.create_all()
+            db.metadata.create_all(replica)
+            for engine, source in ((db.engine, 'primary'), (replica, 'replica')):
+                with engine.begin() as connection:
+                    connection.execute(insert(MBTITrait).values(type='INTJ', strengths=source, weaknesses='-'))
+
+    def tearDown(self):
+        replica_health.healthy = True
+        replica_health._checked_at = 0.0
+        with self.replica_app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        self.replica_app.extensions['db_replica'].dispose()
+        self.tmp.cleanup()
+
+    def _strengths(self):
+        return db.session.scalar(select(MBTITrait.strengths).where(MBTITrait.type == 'INTJ'))
+
+    def test_reads_use_replica_until_session_writes(self):
+        """Test that reads go to the replica until the session writes"""
+        with self.replica_app.app_context():
+            self.assertEqual(self._strengths(), 'replica')
+            db.session.add(MBTITrait(type='ENFP', strengths='-', weaknesses='-'))
+            db.session.commit()
+            self.assertEqual(self._strengths(), 'primary')
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        """Test that reads use the primary while the replica is unhealthy"""
+        replica_health.mark_unhealthy()
+        with self.replica_app.app_context():
+            self.assertEqual(self._strengths(), 'primary')
+
+class AssetPipelineTests(unittest.TestCase):
+    """Tests for the fingerprinted static asset build"""
+
+    def test_build_assets_hashes_and_rewrites_css(self):
+        """Test that the build fingerprints files and rewrites CSS references"""
+        with tempfile.TemporaryDirectory() as static_folder:
+            os.makedirs(os.path.join(static_folder, 'css'))
+            os.makedirs(os.path.join(static_folder, 'images'))
+            with open(os.path.join(static_folder, 'css', 'site.css'), 'w') as f:
+                f.write("body { background: url('/static/images/dot.gif') repeat; }")
+            with open(os.path.join(static_folder, 'images', 'dot.gif'), 'wb') as f:
+                f.write(b'GIF89a')
+
+            manifest = build_assets(static_folder)
+
+            self.assertRegex(manifest['css/site.css'], r'^dist/css/site\.[0-9a-f]{12}\.css$')
+            css_path = os.path.join(static_folder, manifest['css/site.css'])
+            with open(css_path) as f:
+                self.assertIn(manifest['images/dot.gif'], f.read())
+            self.assertTrue(os.path.exists(css_path + '.gz'))
+            self.assertEqual(load_manifest(static_folder), manifest)
+
+    def _serving_app(self, root):
+        """A Flask app whose static folder under root has been built, plus its manifest"""
+        static_folder = os.path.join(root, 'static')
+        os.makedirs(os.path.join(static_folder, 'css'))
+        with open(os.path.join(static_folder, 'css', 'site.css'), 'w') as f:
+            f.write('body { color: #123456; }' * 50)
+        with open(os.path.join(root, 'secret.txt'), 'w') as f:
+            f.write('not a static file')
+        manifest = build_assets(static_folder)
+        flask_app = Flask(__name__, static_folder=static_folder)
+        assets.init_app(flask_app)
+        return flask_app, manifest
+
+    def _get(self, client, path, **headers):
+        response = client.get(path, headers=headers)
+        response.get_data()
+        response.close()
+        return response
+
+    def test_url_for_static_resolves_to_hashed_name(self):
+        """Test that url_for('static') goes through the manifest and leaves unknown files alone"""
+        with tempfile.TemporaryDirectory() as root:
+            flask_app, manifest = self._serving_app(root)
+            with flask_app.test_request_context():
+                self.assertEqual(url_for('static', filename='css/site.css'), '/static/' + manifest['css/site.css'])
+                self.assertEqual(url_for('static', filename='css/missing.css'), '/static/css/missing.css')
+
+    def test_hashed_files_are_immutable(self):
+        """Test that a hashed file is served with far-future immutable caching"""
+        with tempfile.TemporaryDirectory() as root:
+            flask_app, manifest = self._serving_app(root)
+            response = self._get(flask_app.test_client(), '/static/' + manifest['css/site.css'])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['Cache-Control'], assets.IMMUTABLE_CACHE_CONTROL)
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertIn('Accept-Encoding', response.vary)
+            self.assertEqual(response.data, b'body { color: #123456; }' * 50)
+
+    def test_precompressed_variant_follows_accept_encoding(self):
+        """Test that br is preferred over gzip when accepted, and gzip is used otherwise"""
+        with tempfile.TemporaryDirectory() as root:
+            flask_app, manifest = self._serving_app(root)
+            client = flask_app.test_client()
+            path = '/static/' + manifest['css/site.css']
+
+            response = self._get(client, path, **{'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(response.mimetype, 'text/css')
+            self.assertIn('Accept-Encoding', response.vary)
+            self.assertEqual(gzip.decompress(response.data), b'body { color: #123456; }' * 50)
+
+            if assets.brotli is not None:
+                response = self._get(client, path, **{'Accept-Encoding': 'gzip, br'})
+                self.assertEqual(response.headers['Content-Encoding'], 'br')
+                self.assertEqual(response.headers['Cache-Control'], assets.IMMUTABLE_CACHE_CONTROL)
+                self.assertEqual(assets.brotli.decompress(response.data), b'body { color: #123456; }' * 50)
+
+    def test_path_traversal_is_not_found(self):
+        """Test that a dist path escaping the static folder is a 404"""
+        with tempfile.TemporaryDirectory() as root:
+            flask_app, _ = self._serving_app(root)
+            client = flask_app.test_client()
+            for path in ('/static/dist/../../secret.txt', '/static/dist/..%2F..%2Fsecret.txt'):
+                response = self._get(client, path, **{'Accept-Encoding': 'gzip, br'})
+                self.assertEqual(response.status_code, 404, path)
+                self.assertNotIn(b'not a static file', response.data)
+
+@unittest.skipUnless(importlib.util.find_spec('httpx') and importlib.util.find_spec('aiosqlite'),
+                     'ASGI mode needs requirements-async.txt')
+class AsyncServingTests(unittest.TestCase):
+    """Tests for the optional ASGI serving mode"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        with app.app_context():
+            db.create_all()
+            password = Bcrypt(app).generate_password_hash('testuser123').decode('utf-8')
+            db.session.add(User(name='Test User', birthday=date(1992, 5, 15), username='testuser',
+                                email='user@test.com', password=password, mbti='ENFP', chinese_zodiac='Monkey'))
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_daily_fortune_runs_as_coroutine(self):
+        """Test that the async route shares the Flask session and stores the fortune once"""
+        import httpx
+        from asgi import AsyncFortuneApp
+
+        async def scenario():
+            asgi_app = AsyncFortuneApp(app)
+            transport = httpx.ASGITransport(app=asgi_app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                    anonymous = await client.get('/daily_fortune')
+                    # Login goes through the WSGI fallback
+                    await client.post('/login', data={'username': 'testuser', 'password': 'testuser123'})
+                    first = await client.get('/daily_fortune')
+                    second = await client.get('/daily_fortune')
+            finally:
+                await asgi_app._stop()
+            return anonymous, first, second
+
+        anonymous, first, second = asyncio.run(scenario())
+        self.assertEqual(anonymous.status_code, 302)
+        self.assertIn('/login', anonymous.headers['location'])
+        self.assertEqual(first.status_code, 200)
+        self.assertIn(b'taurus', first.content.lower())
+        self.assertEqual(second.status_code, 200)
+        with app.app_context():
+            user = User.query.filter_by(username='testuser').first()
+            self.assertEqual(UserFortune.query.filter_by(user_id=user.id).count(), 1)
+            self.assertIn(user.last_fortune[-40:].encode('utf-8'), second.content)
+
+    def test_daily_fortune_runs_no_sync_sql_on_the_loop(self):
+        """Test that the async route never uses the sync engine (and its pool) on the event loop thread"""
+        import httpx
+        from asgi import AsyncFortuneApp
+
+        threads = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            threads.append(threading.get_ident())
+
+        async def scenario():
+            asgi_app = AsyncFortuneApp(app)
+            transport = httpx.ASGITransport(app=asgi_app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                    await client.post('/login', data={'username': 'testuser', 'password': 'testuser123'})
+                    response = await client.get('/daily_fortune')
+            finally:
+                await asgi_app._stop()
+            return threading.get_ident(), response
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            loop_thread, response = asyncio.run(scenario())
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(loop_thread, threads)
+
+    def test_zodiac_cache_refreshes_off_the_event_loop(self):
+        """Test that a due zodiac cache refresh runs in a worker thread, not on the event loop"""
+        from asgi import AsyncFortuneApp
+
+        with app.app_context():
+            db.session.add(ChineseZodiacFortune(sign='Monkey', year=date.today().year, fortune='Monkey business'))
+            db.session.commit()
+        threads = []
+        load = zodiac_fortunes.load
+
+        def recording_load(*args):
+            threads.append(threading.get_ident())
+            load(*args)
+
+        async def scenario():
+            return threading.get_ident(), await AsyncFortuneApp(app).zodiac_fortune('Monkey')
+
+        zodiac_fortunes.invalidate()
+        zodiac_fortunes.load = recording_load
+        try:
+            loop_thread, fortune = asyncio.run(scenario())
+        finally:
+            del zodiac_fortunes.load
+            zodiac_fortunes.invalidate()
+        self.assertEqual(fortune, 'Monkey business')
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], loop_thread)
+
+    def test_sync_routes_run_concurrently(self):
+        """Test that slow Flask views in ASGI mode overlap instead of queueing on one thread"""
+        import httpx
+        import time
+        from asgi import AsyncFortuneApp
+
+        threads = set()
+        healthz = app.view_functions['healthz']
+
+        def slow_healthz():
+            threads.add(threading.get_ident())
+            time.sleep(0.5)
+            return healthz()
+
+        async def scenario():
+            asgi_app = AsyncFortuneApp(app)
+            transport = httpx.ASGITransport(app=asgi_app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                started = time.perf_counter()
+                responses = await asyncio.gather(client.get('/healthz'), client.get('/healthz'))
+                return time.perf_counter() - started, responses
+
+        app.view_functions['healthz'] = slow_healthz
+        try:
+            elapsed, responses = asyncio.run(scenario())
+        finally:
+            app.view_functions['healthz'] = healthz
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(len(threads), 2)
+        self.assertLess(elapsed, 0.9)
+
+    def test_sync_routes_get_request_body_and_full_response(self):
+        """Test that a Flask view in ASGI mode reads the request body and returns status, headers and body"""
+        import httpx
+        from asgi import AsyncFortuneApp
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=AsyncFortuneApp(app))
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                login = await client.post('/api/v1/login', json={'username': 'testuser', 'password': 'testuser123'})
+                logout = await client.post('/api/v1/logout')
+                return login, logout
+
+        login, logout = asyncio.run(scenario())
+        self.assertEqual(login.status_code, 200)
+        self.assertEqual(login.json()['username'], 'testuser')
+        self.assertIn('session=', login.headers['set-cookie'])
+        self.assertEqual(logout.status_code, 204)
+        self.assertEqual(logout.content, b'')
+
+    def test_async_database_url(self):
+        """Test that sync URLs map to their asyncio drivers"""
+        from asgi import async_database_url
+        self.assertEqual(async_database_url('sqlite:////tmp/site.db').drivername, 'sqlite+aiosqlite')
+        url = async_database_url('postgresql://u:p@db/fortunes?sslmode=require')
+        self.assertEqual(url.drivername, 'postgresql+asyncpg')
+        self.assertEqual(dict(url.query), {'ssl': 'require'})
+
+
+class RateLimiterTests(unittest.TestCase):
+    """Tests for the outbound OpenAI rate limiter"""
+
+    def test_request_bucket_limits_admissions(self):
+        """Test that requests beyond the per-minute budget are not admitted"""
+        limiter = OpenAIRateLimiter(requests_per_minute=2, tokens_per_minute=10000)
+        self.assertTrue(limiter.acquire(100, timeout=0))
+        self.assertTrue(limiter.acquire(100, timeout=0))
+        self.assertFalse(limiter.acquire(100, timeout=0))
+
+    def test_headers_pause_limiter(self):
+        """Test that exhausted rate limit headers pause further calls"""
+        limiter = OpenAIRateLimiter(requests_per_minute=100, tokens_per_minute=10000)
+        self.assertTrue(limiter.acquire(100, timeout=0))
+        limiter.complete(100, used_tokens=80, headers={
+            'x-ratelimit-remaining-requests': '0',
+            'x-ratelimit-reset-requests': '6m0s',
+        })
+        self.assertFalse(limiter.acquire(100, timeout=0))
+
+    def test_breaker_opens_after_failures(self):
+        """Test that repeated failures open the circuit breaker"""
+        limiter = OpenAIRateLimiter(requests_per_minute=100, tokens_per_minute=10000, failure_threshold=2)
+        limiter.failed()
+        limiter.failed()
+        self.assertEqual(limiter.breaker_state, BREAKER_OPEN)
+        self.assertFalse(limiter.acquire(100, timeout=0))
+
+    def test_transient_failures_retry_with_bounded_backoff(self):
+        """Test that transient failures get a bounded number of jittered retries and their tokens back"""
+        limiter = OpenAIRateLimiter(requests_per_minute=100, tokens_per_minute=1000, max_retries=2,
+                                    retry_base_delay=0.5)
+        self.assertTrue(limiter.acquire(400, timeout=0))
+        delay = limiter.retry_delay(400, 1)
+        self.assertTrue(0 <= delay <= 0.5)
+        self.assertGreater(limiter.tokens.tokens, 900)
+        self.assertTrue(0 <= limiter.retry_delay(400, 2) <= 1.0)
+        self.assertIsNone(limiter.retry_delay(400, 3))
+
+    def test_interactive_waiters_admitted_before_earlier_background_waiters(self):
+        """Test that an interactive caller overtakes background callers that queued first"""
+        limiter = OpenAIRateLimiter(requests_per_minute=100, tokens_per_minute=10000)
+        # Hold every caller in the queue until all three are waiting
+        limiter._paused_until = float('inf')
+        admitted = []
+
+        def acquire(name, priority):
+            if limiter.acquire(100, priority=priority, timeout=5):
+                admitted.append(name)
+
+        def wait_for_waiters(count):
+            for _ in range(500):
+                with limiter._condition:
+                    if len(limiter._waiters) == count:
+                        return
+                threading.Event().wait(0.01)
+            self.fail(f"{count} waiters never queued")
+
+        threads = []
+        for name, priority in (('background-1', PRIORITY_BACKGROUND), ('background-2', PRIORITY_BACKGROUND),
+                               ('interactive', PRIORITY_INTERACTIVE)):
+            thread = threading.Thread(target=acquire, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            wait_for_waiters(len(threads))
+
+        with limiter._condition:
+            limiter._paused_until = 0.0
+            limiter._condition.notify_all()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(admitted, ['interactive', 'background-1', 'background-2'])
+
+    def test_acquire_async_waits_for_refill(self):
+        """Test that coroutines wait for capacity without blocking and give up at the timeout"""
+        limiter = OpenAIRateLimiter(requests_per_minute=600, tokens_per_minute=100000)
+        limiter.requests.tokens = 0
+
+        async def acquire(timeout):
+            return await limiter.acquire_async(100, timeout=timeout, poll_interval=0.01)
+
+        self.assertFalse(asyncio.run(acquire(0.01)))
+        # 600 rpm refills one request every 0.1s
+        self.assertTrue(asyncio.run(acquire(1)))
+
+    def test_parse_reset_duration(self):
+        """Test parsing of OpenAI reset header durations"""
+        self.assertEqual(parse_reset_duration('6m0s'), 360.0)
+        self.assertAlmostEqual(parse_reset_duration('20ms'), 0.02)
+        self.assertIsNone(parse_reset_duration(None))
+
+
+class LocalFortuneTests(unittest.TestCase):
+    """Tests for the deterministic local fortune engine"""
+
+    args = (
+        'Today is a day for practical planning and financial decisions. Stay grounded.',
+        'Strategic, Logical, Efficient.',
+        'Arrogant, Judgmental, Overly Analytical.',
+        'Horses will find success in social and professional spheres.',
+    )
+
+    def test_same_key_same_fortune(self):
+        """Test that a (user, date) key always produces the same fortune"""
+        first = generate_local_fortune((1, '2024-05-01'), *self.args)
+        second = generate_local_fortune((1, '2024-05-01'), *self.args)
+        self.assertEqual(first, second)
+        self.assertIn('practical planning', first)
+
+    def test_fortunes_vary_and_stay_short(self):
+        """Test that fortunes vary across days and stay under the word limit"""
+        fortunes = {generate_local_fortune((1, f'2024-05-{day:02d}'), *self.args) for day in range(1, 29)}
+        self.assertGreater(len(fortunes), 10)
+        for fortune in fortunes:
+            self.assertLessEqual(len(fortune.split()), 70)
+
+    def test_longest_output_keeps_horoscope_and_whole_sentences(self):
+        """Test that trimming the longest grammar output drops whole optional sentences only"""
+        horoscope = ' '.join(f'word{index}' for index in range(40)) + '.'
+        trait = 'prone to second guessing every single small decision'
+        zodiac = ' '.join(f'year{index}' for index in range(25)) + '.'
+        sentence_ends = ('.', '!', '?')
+        for day in range(1, 29):
+            fortune = generate_local_fortune((1, f'2024-05-{day:02d}'), horoscope, trait, trait, zodiac)
+            self.assertLessEqual(len(fortune.split()), 70)
+            # The horoscope is cut to its first 30 words, never dropped
+            self.assertIn(' '.join(f'word{index}' for index in range(30)) + '...', fortune)
+            self.assertTrue(fortune.endswith(sentence_ends), fortune)
+
+
+class HoroscopeProviderTests(unittest.TestCase):
+    """Tests for the persistent horoscope response cache"""
+
+    class CountingProvider:
+        def __init__(self, headers=None):
+            self.calls = 0
+            self.headers = headers
+            self.validators = []
+
+        def fetch(self, sign, day, validators=None):
+            self.calls += 1
+            self.validators.append(validators)
+            if validators and validators.get('If-None-Match') == (self.headers or {}).get('ETag'):
+                return HoroscopeResponse(304, None, {'Date': 'Mon, 19 Oct 2026 12:00:00 GMT'})
+            return HoroscopeResponse(200, {'horoscope': f'{sign} {day}'}, self.headers)
+
+    def test_cache_serves_repeat_fetches_from_disk(self):
+        """Test that a second fetch for the same sign and day skips the upstream"""
+        inner = self.CountingProvider()
+        today = datetime.utcnow().date()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = CachingHoroscopeProvider(inner, cache_dir).fetch('leo', today)
+            # A new instance proves the cache is persistent, not in-memory
+            second = CachingHoroscopeProvider(inner, cache_dir).fetch('leo', today)
+            CachingHoroscopeProvider(inner, cache_dir).fetch('leo', today + timedelta(days=1))
+        self.assertEqual(first.horoscope, second.horoscope)
+        self.assertEqual(inner.calls, 2)
+
+    def test_cache_honors_no_store(self):
+        """Test that responses marked no-store are never cached"""
+        inner = self.CountingProvider({'Cache-Control': 'no-store'})
+        today = datetime.utcnow().date()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            provider = CachingHoroscopeProvider(inner, cache_dir)
+            provider.fetch('leo', today)
+            provider.fetch('leo', today)
+            self.assertEqual(os.listdir(cache_dir), [])
+        self.assertEqual(inner.calls, 2)
+
+    def test_cache_keeps_private_and_revalidates_no_cache(self):
+        """Test that private responses are reused and no-cache ones are revalidated with their ETag"""
+        today = datetime.utcnow().date()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            private = self.CountingProvider({'Cache-Control': 'private, max-age=600'})
+            provider = CachingHoroscopeProvider(private, cache_dir)
+            provider.fetch('leo', today)
+            provider.fetch('leo', today)
+            self.assertEqual(private.calls, 1)
+
+            no_cache = self.CountingProvider({'Cache-Control': 'no-cache', 'ETag': '"v1"'})
+            provider = CachingHoroscopeProvider(no_cache, cache_dir)
+            first = provider.fetch('virgo', today)
+            second = provider.fetch('virgo', today)
+        self.assertEqual(no_cache.calls, 2)
+        self.assertEqual(no_cache.validators, [None, {'If-None-Match': '"v1"'}])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.horoscope, first.horoscope)
+
+    def test_record_mode_records_cache_hits(self):
+        """Test that the recorder wraps the cache, so responses served from disk still become cassettes"""
+        today = datetime.utcnow().date()
+        with tempfile.TemporaryDirectory() as cache_dir, tempfile.TemporaryDirectory() as cassette_dir:
+            self.assertIsInstance(build_provider('record', 'key', cache_dir, cassette_dir), RecordingHoroscopeProvider)
+            inner = self.CountingProvider()
+            CachingHoroscopeProvider(inner, cache_dir).fetch('leo', today)
+            provider = RecordingHoroscopeProvider(CachingHoroscopeProvider(inner, cache_dir), cassette_dir)
+            provider.fetch('leo', today)
+            self.assertEqual(inner.calls, 1)
+            with open(os.path.join(cassette_dir, 'leo.json')) as f:
+                self.assertEqual(json.load(f)['response']['body'], {'horoscope': f'leo {today}'})
+
+    def test_default_afetch_runs_fetch_off_the_event_loop(self):
+        """Test that a provider without its own afetch() does not block the loop with fetch()"""
+        class ThreadRecordingProvider(HoroscopeProvider):
+            def fetch(self, sign, day, validators=None):
+                self.thread = threading.get_ident()
+                return HoroscopeResponse(200, {'horoscope': sign})
+
+        provider = ThreadRecordingProvider()
+        response = asyncio.run(provider.afetch('leo', date(2024, 5, 10)))
+        self.assertEqual(response.horoscope, 'leo')
+        self.assertNotEqual(provider.thread, threading.get_ident())
+
+    def test_prune_cache_removes_old_days(self):
+        """Test that prune_cache drops day directories past the retention window only"""
+        today = date(2024, 5, 10)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for day in (today, today - timedelta(days=2), today - timedelta(days=3)):
+                CachingHoroscopeProvider(self.CountingProvider(), cache_dir).fetch('leo', day)
+            os.makedirs(os.path.join(cache_dir, 'not-a-day'))
+            self.assertEqual(prune_cache(cache_dir, today, 2), 1)
+            self.assertEqual(sorted(os.listdir(cache_dir)), ['2024-05-08', '2024-05-10', 'not-a-day'])
+        self.assertEqual(prune_cache(os.path.join(cache_dir, 'missing'), today, 2), 0)
+
+    def test_cache_prunes_old_days_when_a_new_day_starts(self):
+        """Test that the first response cached for a day drops days past keep_days"""
+        today = date(2024, 5, 10)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for day in (today - timedelta(days=3), today - timedelta(days=2)):
+                CachingHoroscopeProvider(self.CountingProvider(), cache_dir).fetch('leo', day)
+            provider = CachingHoroscopeProvider(self.CountingProvider(), cache_dir, keep_days=2)
+            provider.fetch('leo', today)
+            self.assertEqual(sorted(os.listdir(cache_dir)), ['2024-05-08', '2024-05-10'])
+            # Later entries of the same day do not prune again
+            os.makedirs(os.path.join(cache_dir, '2024-05-01'))
+            provider.fetch('virgo', today)
+            self.assertEqual(sorted(os.listdir(cache_dir)), ['2024-05-01', '2024-05-08', '2024-05-10'])
+
+class MigrationTests(unittest.TestCase):
+    """Tests for the Alembic revisions in migrations/versions"""
+
+    @staticmethod
+    def _revisions():
+        """Every revision module, in upgrade order"""
+        versions = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations', 'versions')
+        by_parent = {}
+        for filename in os.listdir(versions):
+            if filename.endswith('.py'):
+                spec = importlib.util.spec_from_file_location(filename[:-3], os.path.join(versions, filename))
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                assert module.down_revision not in by_parent, f"Two revisions follow {module.down_revision}"
+                by_parent[module.down_revision] = module
+        revisions = [by_parent.pop(None)]
+        while revisions[-1].revision in by_parent:
+            revisions.append(by_parent.pop(revisions[-1].revision))
+        # A revision left over is not on the chain (a branch or a wrong down_revision)
+        assert not by_parent, f"Unreachable revisions: {[module.revision for module in by_parent.values()]}"
+        return revisions
+
+    def test_revisions_match_models(self):
+        """Test that upgrading an empty database yields exactly the schema in models.py"""
+        from alembic.autogenerate import compare_metadata
+        from alembic.migration import MigrationContext
+        from alembic.operations import Operations
+        from sqlalchemy import create_engine, inspect
+
+        revisions = self._revisions()
+        self.assertEqual(revisions[0].revision, '0001_baseline')
+        engine = create_engine('sqlite://')
+        with engine.begin() as connection:
+            context = MigrationContext.configure(connection)
+            with Operations.context(context):
+                for revision in revisions:
+                    revision.upgrade()
+                self.assertEqual(compare_metadata(context, db.metadata), [])
+                for revision in reversed(revisions):
+                    revision.downgrade()
+            self.assertEqual(inspect(connection).get_table_names(), [])
+
+class SeedingTests(unittest.TestCase):
+    """Tests for idempotent reference data seeding"""
+
+    def setUp(self):
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_reseed_skips_unchanged_data_and_keeps_ids(self):
+        """Test that seeding twice is a no-op and rows keep their IDs"""
+        with app.app_context():
+            self.assertTrue(sync_reference_data(db, 'mbti', MBTITrait, mbti_data, key='type'))
+            ids = {trait.type: trait.id for trait in MBTITrait.query.all()}
+            self.assertFalse(sync_reference_data(db, 'mbti', MBTITrait, mbti_data, key='type'))
+            self.assertEqual(ids, {trait.type: trait.id for trait in MBTITrait.query.all()})
+
+    def test_reseed_applies_changes_in_place(self):
+        """Test that changed seed data is upserted and stale rows removed"""
+        with app.app_context():
+            sync_reference_data(db, 'mbti', MBTITrait, mbti_data, key='type')
+            intj_id = MBTITrait.query.filter_by(type='INTJ').first().id
+            changed = [dict(row) for row in mbti_data if row['type'] != 'ESFP']
+            changed[0]['strengths'] = 'Updated strengths.'
+            self.assertTrue(sync_reference_data(db, 'mbti', MBTITrait, changed, key='type'))
+            intj = MBTITrait.query.filter_by(type='INTJ').first()
+            self.assertEqual(intj.id, intj_id)
+            self.assertEqual(intj.strengths, 'Updated strengths.')
+            self.assertIsNone(MBTITrait.query.filter_by(type='ESFP').first())
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
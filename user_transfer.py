@@ -0,0 +1,240 @@
+"""
+Streaming bulk import and export of user accounts.
+
+Both directions work row by row over CSV or JSONL so memory use stays
+constant regardless of file size. Imports validate each row, hash plain text
+passwords in a process pool (bcrypt is CPU bound), fill in the Chinese zodiac
+and insert in batched transactions, updating the cohort counters with each
+batch. Exported rows carry the password hash, so
+an export can be re-imported as-is.
+"""
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import bcrypt
+from email_validator import validate_email, EmailNotValidError
+from sqlalchemy import insert, select, or_
+
+import cohorts
+from forms import mbti_choices
+from models import User
+
+EXPORT_FIELDS = ['name', 'birthday', 'username', 'email', 'password_hash', 'mbti', 'chinese_zodiac', 'role']
+MBTI_TYPES = {value for value, _ in mbti_choices if value}
+ROLES = {'user', 'admin'}
+
+
+class RowError(ValueError):
+    """A row that failed validation"""
+
+
+def detect_format(path, fmt=None):
+    """Pick 'csv' or 'jsonl' from an explicit format or the file extension"""
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict) pairs from a CSV or JSONL stream"""
+    if fmt == 'csv':
+        for line_number, row in enumerate(csv.DictReader(stream), start=2):
+            yield line_number, row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, RowError(f"invalid JSON: {e}")
+
+
+def validate_row(row, get_chinese_zodiac):
+    """
+    Validate and normalise one import row
+
+    Args:
+        row (dict): Raw row from the import file
+        get_chinese_zodiac (callable): Maps a birth year to a Chinese zodiac sign
+
+    Returns:
+        dict: Column values for User, with either 'password' (plain text to
+            hash) or 'password_hash' set
+    """
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError("row must be a JSON object")
+
+    def field(name, strip=True):
+        value = row.get(name)
+        if value is None:
+            return None
+        if not isinstance(value, str):
+            raise RowError(f"{name} must be a string")
+        return value.strip() if strip else value
+
+    name = field('name')
+    if not name or not 2 <= len(name) <= 50:
+        raise RowError("name must be 2-50 characters")
+    username = field('username')
+    if not username or not 2 <= len(username) <= 20:
+        raise RowError("username must be 2-20 characters")
+    email = field('email') or ''
+    try:
+        email = validate_email(email, check_deliverability=False).normalized
+    except EmailNotValidError as e:
+        raise RowError(f"invalid email: {e}")
+    birthday = field('birthday') or ''
+    try:
+        birthday = datetime.strptime(birthday, '%Y-%m-%d').date()
+    except ValueError:
+        raise RowError("birthday must be YYYY-MM-DD")
+    mbti = (field('mbti') or '').upper() or None
+    if mbti and mbti not in MBTI_TYPES:
+        raise RowError(f"unknown MBTI type {mbti}")
+    role = field('role') or 'user'
+    if role not in ROLES:
+        raise RowError(f"unknown role {role}")
+
+    user = {
+        'name': name,
+        'username': username,
+        'email': email,
+        'birthday': birthday,
+        'mbti': mbti,
+        'role': role,
+        'chinese_zodiac': get_chinese_zodiac(birthday.year),
+    }
+    password_hash = field('password_hash')
+    password = field('password', strip=False)
+    if password_hash:
+        if not password_hash.startswith('$2'):
+            raise RowError("password_hash is not a bcrypt hash")
+        user['password_hash'] = password_hash
+    elif password and len(password) >= 8:
+        user['password'] = password
+    else:
+        raise RowError("password must be at least 8 characters")
+    return user
+
+
+def hash_password(password, rounds):
+    """Hash one password; runs in a worker process"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _hash_batch(pool, batch, rounds):
+    pending = [user for user in batch if 'password' in user]
+    if pending:
+        hashes = pool.map(hash_password, [user.pop('password') for user in pending], [rounds] * len(pending),
+                          chunksize=max(1, len(pending) // (os.cpu_count() or 1)))
+        for user, password_hash in zip(pending, hashes):
+            user['password_hash'] = password_hash
+    for user in batch:
+        user['password'] = user.pop('password_hash')
+
+
+def _insert_batch(session, batch):
+    """Insert the batch and count it in the cohorts, skipping usernames/emails already present; returns rows inserted"""
+    usernames = [user['username'] for user in batch]
+    emails = [user['email'] for user in batch]
+    existing = session.execute(
+        select(User.username, User.email).where(or_(User.username.in_(usernames), User.email.in_(emails)))
+    ).all()
+    taken = {value for row in existing for value in row}
+    rows = []
+    for user in batch:
+        if user['username'] in taken or user['email'] in taken:
+            continue
+        # Catches duplicates within this batch; earlier batches are committed and found by the query above
+        taken.update((user['username'], user['email']))
+        rows.append(user)
+    if rows:
+        session.execute(insert(User), rows)
+        cohorts.record_new_users(session, [
+            cohorts.user_cohorts(cohorts.sun_sign(user['birthday'].day, user['birthday'].month), user['mbti'], user['chinese_zodiac'])
+            for user in rows
+        ])
+    session.commit()
+    return len(rows)
+
+
+def import_users(session, stream, fmt, get_chinese_zodiac, batch_size=1000, rounds=12, workers=None,
+                 progress=None, errors=None):
+    """
+    Import users from a CSV or JSONL stream in batched transactions
+
+    Args:
+        session: SQLAlchemy session
+        stream: Text stream to read from
+        fmt (str): 'csv' or 'jsonl'
+        get_chinese_zodiac (callable): Maps a birth year to a Chinese zodiac sign
+        batch_size (int): Rows per transaction
+        rounds (int): bcrypt cost factor for plain text passwords
+        workers (int): Hashing processes, defaults to the CPU count
+        progress (callable): Called with (imported, skipped) after each batch
+        errors (callable): Called with (line number, message) for invalid rows
+
+    Returns:
+        tuple: (imported, skipped) row counts
+    """
+    imported = skipped = 0
+    batch = []
+
+    def flush():
+        nonlocal imported, skipped
+        _hash_batch(pool, batch, rounds)
+        inserted = _insert_batch(session, batch)
+        imported += inserted
+        skipped += len(batch) - inserted
+        batch.clear()
+        if progress:
+            progress(imported, skipped)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for line_number, row in read_rows(stream, fmt):
+            try:
+                batch.append(validate_row(row, get_chinese_zodiac))
+            except RowError as e:
+                skipped += 1
+                if errors:
+                    errors(line_number, str(e))
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    return imported, skipped
+
+
+def export_users(session, stream, fmt, batch_size=1000):
+    """
+    Stream every user to a CSV or JSONL stream
+
+    Returns:
+        int: Number of users written
+    """
+    columns = [User.name, User.birthday, User.username, User.email, User.password, User.mbti,
+               User.chinese_zodiac, User.role]
+    result = session.execute(select(*columns).order_by(User.id).execution_options(yield_per=batch_size))
+
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(EXPORT_FIELDS)
+
+    count = 0
+    for row in result:
+        values = [value.isoformat() if field == 'birthday' else value for field, value in zip(EXPORT_FIELDS, row)]
+        if writer is not None:
+            writer.writerow(['' if value is None else value for value in values])
+        else:
+            stream.write(json.dumps(dict(zip(EXPORT_FIELDS, values))) + '\n')
+        count += 1
+    return count
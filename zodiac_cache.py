@@ -0,0 +1,106 @@
+"""
+In-memory cache of the active year's Chinese zodiac fortunes.
+
+The active year is the latest year with seeded fortunes that is not in the
+future, so the yearly rollover is just a matter of seeding the new year's
+rows. The twelve rows are loaded once per process and swapped in atomically
+as a single snapshot; the cache reloads itself when the calendar year
+changes, and otherwise checks the seed digest every few minutes so newly
+seeded data is picked up without a restart. Those checks query the database
+through db.session; coroutine callers use stale() to run refresh() in a
+thread and then get(sign, refresh=False).
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+
+from models import db, ChineseZodiacFortune, SeedState
+
+logger = logging.getLogger(__name__)
+
+SEED_NAME = 'chinese_zodiac_fortune'
+
+
+class _Snapshot:
+    def __init__(self, calendar_year, year, fortunes, digest):
+        self.calendar_year = calendar_year
+        self.year = year
+        self.fortunes = fortunes
+        self.digest = digest
+
+
+class ZodiacFortuneCache:
+    """Process-wide cache of {sign: fortune} for the active year"""
+
+    def __init__(self, revalidate_seconds=600):
+        self.revalidate_seconds = revalidate_seconds
+        self._snapshot = _Snapshot(None, None, {}, None)
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def year(self):
+        return self._snapshot.year
+
+    def load(self, calendar_year=None):
+        """Load the active year's fortunes and swap them in (requires an app context)"""
+        calendar_year = calendar_year or datetime.now(timezone.utc).year
+        active_year = select(func.max(ChineseZodiacFortune.year)).where(
+            ChineseZodiacFortune.year <= calendar_year
+        ).scalar_subquery()
+        rows = db.session.execute(
+            select(ChineseZodiacFortune.sign, ChineseZodiacFortune.year, ChineseZodiacFortune.fortune)
+            .where(ChineseZodiacFortune.year == active_year)
+        ).all()
+        state = db.session.get(SeedState, SEED_NAME)
+        year = rows[0].year if rows else None
+        self._snapshot = _Snapshot(calendar_year, year, {row.sign: row.fortune for row in rows},
+                                   state.digest if state else None)
+        self._checked_at = time.monotonic()
+        logger.info(f"Loaded {len(rows)} Chinese zodiac fortunes for {year}")
+
+    def invalidate(self):
+        """Force a reload on the next lookup"""
+        self._checked_at = 0.0
+        self._snapshot = _Snapshot(None, self._snapshot.year, self._snapshot.fortunes, None)
+
+    def stale(self):
+        """True when the next get() would check the database"""
+        return (self._snapshot.calendar_year != datetime.now(timezone.utc).year
+                or time.monotonic() - self._checked_at >= self.revalidate_seconds)
+
+    def refresh(self):
+        """Revalidate the snapshot if it is stale (requires an app context)"""
+        if not self.stale():
+            return
+        snapshot = self._snapshot
+        calendar_year = datetime.now(timezone.utc).year
+        # Only one thread refreshes; the others keep serving the current snapshot.
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if snapshot.calendar_year == calendar_year:
+                state = db.session.get(SeedState, SEED_NAME)
+                if state is not None and state.digest == snapshot.digest:
+                    self._checked_at = time.monotonic()
+                    return
+            self.load(calendar_year)
+        except Exception as e:
+            # Keep serving what we have and try again after the next interval
+            self._checked_at = time.monotonic()
+            logger.error(f"Error loading Chinese zodiac fortunes: {e}")
+        finally:
+            self._lock.release()
+
+    def get(self, sign, refresh=True):
+        """Return the active year's fortune for `sign`, or None; refresh=False never touches the database"""
+        if refresh:
+            self.refresh()
+        return self._snapshot.fortunes.get(sign)
+
+
+zodiac_fortunes = ZodiacFortuneCache(int(os.getenv('ZODIAC_CACHE_REVALIDATE_SECONDS', '600')))